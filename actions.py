@@ -2,12 +2,17 @@ from __future__ import annotations
 
 import copy
 import random
+import time
 
+from .metrics import METRICS
 from .state import Game, GameState, PlayerState, Choice, Resources
+from .state import ConflictError, get_outcomes
 
 
 class Action:
 
+    VERIFY = False
+
     COSTS = {
         'road': Resources({'R0': -1, 'R1': -1}),
         'camp': Resources({'R0': -1, 'R1': -1, 'R2': -1, 'R3': -1}),
@@ -24,29 +29,172 @@ class Action:
         self.state: GameState
         self.action_params: tuple
 
-    def choose(self, option: str, argument: int | str | None = None):
+        self.outcomes: list[int | str] = []
+        self.keep_states = True
+        self.base_version = 0
+
+    def choose(self,
+               option: str,
+               argument: int | str | None = None,
+               version: int | None = None):
+
+        start = time.perf_counter()
+
+        with self.game.lock:
+            last_state = self.begin(version)
+            self.validate(last_state, option, argument)
+
+            if self.game.in_place:
+                self.state = last_state
+                self.keep_states = False
+            else:
+                self.state = copy.deepcopy(last_state)
+            self.apply(option, argument)
+            self.commit_state()
+
+        METRICS.observe('catan_choose_seconds', time.perf_counter() - start)
+
+    def apply_many(self,
+                   records: list[tuple],
+                   trusted: bool = True,
+                   commit_all: bool = False,
+                   version: int | None = None):
+
+        with self.game.lock, METRICS.pause(trusted):
+            self.state = copy.deepcopy(self.begin(version))
+            deltas: list[Resources | None] = [None] * self.player_count
+            steps: list[tuple] = []
+            self.keep_states = commit_all
+
+            try:
+                for player_index, option, argument, *outcomes in records:
+                    self.index = player_index
+                    self.outcomes = list(outcomes[0]) if outcomes else []
+                    if not trusted:
+                        self.validate(self.state, option, argument)
+                    steps.append(self.apply_step(option, argument))
+                    deltas = self.state.deltas
+                    self.commit_state()
+            finally:
+                self.keep_states = True
+                self.outcomes = []
+
+            if not commit_all:
+                self.state.deltas = deltas
+                self.state.steps = steps
+                self.game.append_state(self.state, self.base_version)
+
+    def choose_many(self,
+                    steps: list[tuple[str, int | str | None]],
+                    version: int | None = None):
+
+        with self.game.lock:
+            self.state = copy.deepcopy(self.begin(version))
+            deltas: list[Resources | None] = [None] * self.player_count
+            records: list[tuple] = []
+            self.keep_states = False
+
+            try:
+                for option, argument in steps:
+                    self.validate(self.state, option, argument)
+                    records.append(self.apply_step(option, argument))
+                    for index, delta in enumerate(self.state.deltas):
+                        if delta is None:
+                            continue
+                        total = deltas[index]
+                        if total is None:
+                            total = deltas[index] = Resources({})
+                        for res_key, amount in delta.items():
+                            total[res_key] += amount
+                    self.commit_state()
+            finally:
+                self.keep_states = True
+
+            self.state.deltas = deltas
+            self.state.steps = records
+            self.game.append_state(self.state, self.base_version)
+
+    def begin(self, version: int | None) -> GameState:
+
+        last_state = self.game.states[-1]
+        if version is not None and version != last_state.version:
+            raise ConflictError(
+                f"move based on version {version}, "
+                f"game is at version {last_state.version}")
+        self.base_version = last_state.version
+        return last_state
+
+    def submit_trade(self,
+                     partner_index: int,
+                     request_key: str,
+                     offer_key: str | None = None,
+                     amount: int = 0,
+                     version: int | None = None):
+
+        steps: list[tuple[str, int | str | None]] = [
+            ('trade', None),
+            ('player', partner_index),
+            ('res', request_key),
+        ]
+        if offer_key is None:
+            steps.append(('nothing', None))
+        else:
+            steps.append(('res', offer_key))
+            steps.append(('amount', amount))
+
+        self.choose_many(steps, version)
 
-        player = self.get_player()
-        choice = player.choice
+    def submit_drops(self,
+                     res_keys: list[str],
+                     version: int | None = None):
+
+        steps: list[tuple[str, int | str | None]] = [
+            ('res', r) for r in res_keys]
+        steps.append(('commit', len(res_keys)))
+
+        self.choose_many(steps, version)
+
+    def submit_roads(self,
+                     edge_ids: list[str],
+                     version: int | None = None):
+
+        steps: list[tuple[str, int | str | None]] = [
+            ('play', "Road Building")]
+        steps += [('road', e) for e in edge_ids]
+
+        self.choose_many(steps, version)
+
+    def validate(self,
+                 state: GameState,
+                 option: str,
+                 argument: int | str | None):
+
+        choice = state.players[self.index].choice
         assert choice is not None, f"no choice for {self.index}"
 
         assert option in choice.options, option
 
-        args = choice.option_args.get(option)
+        args = choice.get_args(state, option)
         if args is None:
             assert argument is None, (option, argument)
         else:
             assert argument in args, (option, argument)
 
+    def apply(self, option: str, argument: int | str | None):
+
+        choice = self.get_choice()
         self.action_params = choice.action_params
 
-        self.state = copy.deepcopy(self.game.states[-1])
         self.state.actor = self.index
         self.state.action = choice.action
         self.state.option = option
         self.state.argument = argument
         self.state.deltas = [None] * self.player_count
-        self.state.players[self.index].choice = None
+        self.state.steps = None
+        self.state.set_choice(self.index, None)
+
+        METRICS.increment('catan_actions_total',
+                          f'action="{choice.action}",option="{option}"')
 
         method = getattr(self, choice.action + '_' + option)
         if argument is None:
@@ -54,20 +202,41 @@ class Action:
         else:
             method(argument)
 
-        self.commit_state()
+    def apply_step(self, option: str, argument: int | str | None) -> tuple:
+
+        actor = self.index
+        action = self.get_choice().action
+        self.apply(option, argument)
+        return (actor, action, option, argument, get_outcomes(self.state))
 
     def commit_state(self):
 
-        for player, delta in zip(self.state.players, self.state.deltas):
+        state = self.state
+        state.version += 1
+
+        for index, delta in enumerate(state.deltas):
             if delta is None:
                 continue
+            resources = state.players[index].resources
             for res_key, amount in delta.items():
-                player.resources[res_key] += amount
+                if amount == 0:
+                    continue
+                state.toggle_key('res', index, res_key, resources[res_key])
+                resources[res_key] += amount
+                state.toggle_key('res', index, res_key, resources[res_key])
 
-        final_state = copy.deepcopy(self.state)
-        self.game.states.append(final_state)
+        if self.VERIFY:
+            state.verify_points()
+            state.verify_zobrist()
+            state.verify_options()
 
-        self.state.deltas = [None] * self.player_count
+        if self.keep_states:
+            final_state = copy.deepcopy(state)
+            self.game.append_state(final_state, self.base_version)
+            self.base_version = final_state.version
+            METRICS.observe('catan_history_length', len(self.game.states))
+
+        state.deltas = [None] * self.player_count
 
     def get_player(self) -> PlayerState:
 
@@ -87,13 +256,12 @@ class Action:
 
         if player_index is None:
             player_index = self.index
-        self.state.players[player_index].choice = choice
+        self.state.set_choice(player_index, choice)
 
     def build_base_camp_choice(self, action: str) -> Choice:
 
         choice = Choice(action, "")
-        node_ids = self.state.get_basecamp_options()
-        choice.add_option('camp', node_ids)
+        choice.defer_option('camp', 'get_basecamp_options')
         return choice
 
     def build_base_road_choice(self, action: str, node_id: str) -> Choice:
@@ -117,7 +285,7 @@ class Action:
             self.state.round += 1
             choice = self.build_base_camp_choice('base2')
         else:
-            self.state.current += 1
+            self.state.set_current(self.state.current + 1)
             choice = self.build_base_camp_choice('base1')
 
         self.set_choice(choice, self.state.current)
@@ -138,7 +306,7 @@ class Action:
             self.start_next_turn()
             return
 
-        self.state.current -= 1
+        self.state.set_current(self.state.current - 1)
         choice = self.build_base_camp_choice('base2')
         self.set_choice(choice, self.state.current)
 
@@ -148,9 +316,12 @@ class Action:
 
         self.index = self.state.current
 
-        dice1 = random.randrange(6)
-        dice2 = random.randrange(6)
-        roll = 2 + dice1 + dice2
+        if len(self.outcomes) > 0:
+            roll = self.outcomes.pop(0)
+        else:
+            dice1 = random.randrange(6)
+            dice2 = random.randrange(6)
+            roll = 2 + dice1 + dice2
 
         self.state.actor = self.index
         self.state.action = 'roll'
@@ -245,23 +416,15 @@ class Action:
 
     def move_robber(self, tile_id: str):
 
-        self.state.robber = tile_id
-
-        owners = self.state.get_adjacent_owners(tile_id)
-        victim_indices: set[int] = set()
-        for index in owners.values():
-            if index == self.index:
-                continue
-            if self.state.players[index].resources.count() == 0:
-                continue
-            victim_indices.add(index)
+        self.state.set_robber(tile_id)
 
+        victim_indices = self.state.get_robber_victims(tile_id, self.index)
         if len(victim_indices) == 0:
             self.continue_turn()
             return
 
         choice = Choice('rob')
-        choice.add_option('player', sorted(victim_indices))
+        choice.add_option('player', victim_indices)
         choice.add_option('none')
         self.set_choice(choice)
 
@@ -275,7 +438,10 @@ class Action:
         rob_choices = []
         for res_key, amount in resources.items():
             rob_choices += [res_key] * amount
-        rob_res_key = random.choice(rob_choices)
+        if len(self.outcomes) > 0:
+            rob_res_key = self.outcomes.pop(0)
+        else:
+            rob_res_key = random.choice(rob_choices)
         self.state.deltas[self.index] = Resources({rob_res_key: 1})
         self.state.deltas[player_index] = Resources({rob_res_key: -1})
         self.continue_turn()
@@ -291,19 +457,14 @@ class Action:
 
         choice = Choice('turn')
 
-        points = self.state.compute_points(self.index)
-        if points >= self.game.WIN_POINTS:
+        if player.points >= self.game.WIN_POINTS:
             choice.add_option('win')
 
         if self.can_afford(resources, 'road'):
-            edge_ids = self.state.get_road_options(self.index)
-            if len(edge_ids) > 0:
-                choice.add_option('road', edge_ids)
+            choice.defer_option('road', 'get_road_options', self.index)
 
         if self.can_afford(resources, 'camp') and len(player.camps) < 5:
-            node_ids = self.state.get_camp_options(self.index)
-            if len(node_ids) > 0:
-                choice.add_option('camp', node_ids)
+            choice.defer_option('camp', 'get_camp_options', self.index)
 
         if self.can_afford(resources, 'fort') and len(player.forts) < 4:
             node_ids = self.state.get_fort_options(self.index)
@@ -320,7 +481,7 @@ class Action:
 
         swap_res_keys: list[str] = []
         for res_key, amount in resources.items():
-            rate = self.state.get_swap_rate(self.index, res_key)
+            rate = player.swap_rates[res_key]
             if amount >= rate:
                 swap_res_keys.append(res_key)
 
@@ -339,17 +500,20 @@ class Action:
 
     def turn_win(self):
 
-        self.state.winner_index = self.index
+        self.state.set_winner(self.index)
+        METRICS.increment('catan_games_finished_total')
 
     def turn_end(self):
 
+        self.state.toggle_cards(self.index)
         self.get_player().unlock_cards()
+        self.state.toggle_cards(self.index)
 
         if self.state.current == self.player_count - 1:
-            self.state.current = 0
+            self.state.set_current(0)
             self.state.round += 1
         else:
-            self.state.current += 1
+            self.state.set_current(self.state.current + 1)
 
         self.start_next_turn()
 
@@ -375,10 +539,13 @@ class Action:
 
         card = self.state.stack.pop()
         player = self.get_player()
+        self.state.toggle_cards(self.index)
         if card in PlayerState.VICTORY_CARDS:
             player.cards.append(card)
+            player.points += 1
         else:
             player.draws.append(card)
+        self.state.toggle_cards(self.index)
 
         self.state.deltas[self.index] = self.COSTS['card']
         self.continue_turn()
@@ -407,12 +574,12 @@ class Action:
     def turn_play(self, card: str):
 
         player = self.get_player()
+        self.state.toggle_cards(self.index)
         player.discard_card(card)
+        self.state.toggle_cards(self.index)
 
         if card == "Road Building":
-            choice = Choice('roads', 1)
-            edge_ids = self.state.get_road_options(self.index)
-            choice.add_option('road', edge_ids)
+            choice = self.build_roads_choice(1)
         elif card == "Monopoly":
             choice = Choice('monopoly')
             choice.add_option('res', Resources.KEYS)
@@ -508,6 +675,7 @@ class Action:
             {request_key: -1, offer_key: amount})
         self.state.deltas[player_index] = Resources(
             {request_key: 1, offer_key: -amount})
+        METRICS.increment('catan_trades_total')
 
         self.continue_turn()
 
@@ -520,6 +688,7 @@ class Action:
         player_index, request_key = self.action_params
         self.state.deltas[self.index] = Resources({request_key: -1})
         self.state.deltas[player_index] = Resources({request_key: 1})
+        METRICS.increment('catan_trades_total')
 
         self.continue_turn()
 
@@ -541,6 +710,16 @@ class Action:
 
         self.continue_turn()
 
+    def build_roads_choice(self, num: int) -> Choice:
+
+        edge_ids = self.state.get_road_options(self.index)
+        if len(edge_ids) == 0:
+            return self.build_turn_choice()
+
+        choice = Choice('roads', num)
+        choice.add_option('road', edge_ids)
+        return choice
+
     def roads_road(self, edge_id: str):
 
         num, = self.action_params
@@ -548,9 +727,7 @@ class Action:
         self.build_road(edge_id)
 
         if num == 1:
-            choice = Choice('roads', 2)
-            edge_ids = self.state.get_road_options(self.index)
-            choice.add_option('road', edge_ids)
+            choice = self.build_roads_choice(2)
             self.set_choice(choice)
         else:
             self.continue_turn()
@@ -571,17 +748,31 @@ class Action:
     def build_road(self, edge_id: str):
 
         self.get_player().roads.add(edge_id)
+        self.state.toggle_key('road', self.index, edge_id)
+        self.state.update_road_options(self.index, edge_id)
         self.state.update_road_length(self.index)
 
     def build_camp(self, node_id: str):
 
-        self.get_player().camps.add(node_id)
+        player = self.get_player()
+        player.camps.add(node_id)
+        player.points += 1
+        self.state.toggle_key('camp', self.index, node_id)
+        player.add_harbor(node_id)
+        player.add_production(self.game.node_yields[node_id])
+        player.add_tile_shares(node_id)
+        self.state.update_camp_options(self.index, node_id)
 
     def build_fort(self, node_id: str):
 
         player = self.get_player()
         player.camps.remove(node_id)
         player.forts.add(node_id)
+        player.points += 1
+        self.state.toggle_key('camp', self.index, node_id)
+        self.state.toggle_key('fort', self.index, node_id)
+        player.add_production(self.game.node_yields[node_id])
+        player.add_tile_shares(node_id)
 
     def can_afford(self, resources: Resources, item: str) -> bool:
 
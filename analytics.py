@@ -0,0 +1,200 @@
+from __future__ import annotations
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Iterable, Iterator
+import os
+
+from .state import Game
+
+
+class Reducer:
+
+    NAME = ''
+
+    def create(self) -> Any:
+
+        return Counter()
+
+    def update(self, partial: Any, game: Game):
+
+        raise NotImplementedError()
+
+    def merge(self, partial: Any, other: Any) -> Any:
+
+        partial.update(other)
+        return partial
+
+    def finish(self, partial: Any) -> Any:
+
+        return partial
+
+
+class OpeningReducer(Reducer):
+
+    NAME = 'opening'
+
+    def update(self, partial: Counter, game: Game):
+
+        final_state = game.states[-1]
+        pips = [0] * len(game.players)
+
+        for state in game.get_history()[1:]:
+            if state.action in ['base1', 'base2'] and state.option == 'camp':
+                for tile_id in game.board.node_tiles[state.argument]:
+                    roll = game.rolls[tile_id]
+                    if roll is not None:
+                        pips[state.actor] += 6 - abs(7 - roll)
+
+        for index, pip_count in enumerate(pips):
+            partial[pip_count, 'placed'] += 1
+            if index == final_state.winner_index:
+                partial[pip_count, 'won'] += 1
+
+    def finish(self, partial: Counter) -> dict[int, tuple[int, float]]:
+
+        pip_counts = sorted({k[0] for k in partial})
+        return {p: (partial[p, 'placed'],
+                    partial[p, 'won'] / partial[p, 'placed'])
+                for p in pip_counts}
+
+
+class IncomeReducer(Reducer):
+
+    NAME = 'income'
+
+    def update(self, partial: Counter, game: Game):
+
+        rounds: set[int] = set()
+        for state in game.get_history()[1:]:
+            if state.action != 'roll':
+                continue
+            for delta in state.deltas:
+                if delta is not None:
+                    partial[state.round, 'income'] += sum(
+                        n for n in delta.values() if n > 0)
+            rounds.add(state.round)
+
+        for round_number in rounds:
+            partial[round_number, 'players'] += len(game.players)
+
+    def finish(self, partial: Counter) -> dict[int, float]:
+
+        rounds = sorted({k[0] for k in partial})
+        return {r: partial[r, 'income'] / partial[r, 'players']
+                for r in rounds}
+
+
+class TradeReducer(Reducer):
+
+    NAME = 'trade'
+
+    def update(self, partial: Counter, game: Game):
+
+        for state in game.get_history()[1:]:
+            if state.action in ['trade', 'donate']:
+                partial[state.action, state.option] += 1
+
+    def finish(self, partial: Counter) -> dict[str, tuple[int, float]]:
+
+        rates: dict[str, tuple[int, float]] = {}
+        for action, accepted in [('trade', 'accept'), ('donate', 'grant')]:
+            total = partial[action, accepted] + partial[action, 'decline']
+            rate = partial[action, accepted] / total if total > 0 else 0.0
+            rates[action] = (total, rate)
+        return rates
+
+
+class AwardReducer(Reducer):
+
+    NAME = 'award'
+
+    def update(self, partial: Counter, game: Game):
+
+        longest = None
+        largest = None
+
+        for state in game.get_history()[1:]:
+            if state.longest_road_index != longest:
+                longest = state.longest_road_index
+                partial['longest', state.round] += 1
+            if state.largest_army_index != largest:
+                largest = state.largest_army_index
+                partial['largest', state.round] += 1
+
+    def finish(self, partial: Counter) -> dict[str, dict[int, int]]:
+
+        swings: dict[str, dict[int, int]] = {'longest': {}, 'largest': {}}
+        for (award, round), count in sorted(partial.items()):
+            swings[award][round] = count
+        return swings
+
+
+REDUCERS = [OpeningReducer(), IncomeReducer(), TradeReducer(), AwardReducer()]
+
+
+def iter_game_paths(directory: str, suffix: str = '.pickle') -> Iterator[str]:
+
+    for root, _, file_names in os.walk(directory):
+        for file_name in sorted(file_names):
+            if file_name.endswith(suffix):
+                yield os.path.join(root, file_name)
+
+
+def iter_games(paths: Iterable[str]) -> Iterator[Game]:
+
+    for path in paths:
+        yield Game.load(path)
+
+
+def reduce_games(games: Iterable[Game], reducers: list[Reducer]) -> list:
+
+    partials = [r.create() for r in reducers]
+    for game in games:
+        for reducer, partial in zip(reducers, partials):
+            reducer.update(partial, game)
+    return partials
+
+
+def reduce_paths(paths: list[str], reducers: list[Reducer]) -> list:
+
+    return reduce_games(iter_games(paths), reducers)
+
+
+def iter_chunks(paths: Iterable[str], size: int) -> Iterator[list[str]]:
+
+    chunk: list[str] = []
+    for path in paths:
+        chunk.append(path)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def analyze(paths: Iterable[str],
+            reducers: list[Reducer] = REDUCERS,
+            max_workers: int | None = None,
+            chunk_size: int = 64,
+            ) -> dict[str, Any]:
+
+    partials = [r.create() for r in reducers]
+    max_pending = 2 * (max_workers or os.cpu_count() or 1)
+
+    def merge(future: Future):
+
+        for index, other in enumerate(future.result()):
+            partials[index] = reducers[index].merge(partials[index], other)
+
+    with ProcessPoolExecutor(max_workers) as executor:
+        pending: list[Future] = []
+
+        for chunk in iter_chunks(paths, chunk_size):
+            if len(pending) == max_pending:
+                merge(pending.pop(0))
+            pending.append(executor.submit(reduce_paths, chunk, reducers))
+
+        for future in pending:
+            merge(future)
+
+    return {r.NAME: r.finish(p) for r, p in zip(reducers, partials)}
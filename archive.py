@@ -0,0 +1,288 @@
+from __future__ import annotations
+from typing import Iterator
+import fcntl
+import mmap
+import os
+import struct
+
+from .state import Game, GameState, PlayerState, Player, Human, Bot, Resources
+from .actions import Action
+from .board import Board, STANDARD_BOARD
+from .metrics import METRICS
+
+
+ACTIONS = [
+    'game', 'base1', 'base2', 'roll', 'select', 'drop', 'move', 'rob',
+    'turn', 'swap', 'partner', 'request', 'offer', 'quote', 'trade',
+    'donate', 'monopoly', 'roads', 'plenty',
+]
+
+OPTIONS = [
+    'start', 'camp', 'road', 'yield', 'robber', 'res', 'reset', 'commit',
+    'none', 'player', 'win', 'end', 'fort', 'card', 'swap', 'play', 'trade',
+    'cancel', 'nothing', 'amount', 'decline', 'accept', 'grant',
+]
+
+CARDS = PlayerState.VICTORY_CARDS + sorted(set(PlayerState.PROGRESS_CARDS))
+
+MAGIC = b'CTNA'
+NONE = 255
+
+HEADER = struct.Struct('<4sQBBHI')  # magic, seed, players, stack, tiles, recs
+PLAYER = struct.Struct('<BBB')  # is bot, name and strategy length (utf-8)
+RECORD = struct.Struct('<BBBBHBB')  # actor, action, option, argument kind,
+                                    # argument, roll, stolen resource
+INDEX = struct.Struct('<Q')
+
+ARG_NONE = 0
+ARG_INT = 1
+ARG_STR = 2
+
+RECORD_COLUMNS = {  # item format and position within a record
+    'actor': ('B', 0),
+    'action': ('B', 1),
+    'option': ('B', 2),
+    'kind': ('B', 3),
+    'argument': ('H', 2),
+    'roll': ('B', 6),
+    'stolen': ('B', 7),
+}
+
+
+def get_argument_keys(board: Board) -> list[str]:
+
+    return (board.edge_ids + board.node_ids + board.tile_ids
+            + Resources.KEYS + CARDS)
+
+
+def encode_game(game: Game, seed: int = 0) -> bytes:
+
+    board = game.board
+    argument_keys = get_argument_keys(board)
+    argument_codes = {k: i for i, k in enumerate(argument_keys)}
+
+    steps = game.get_steps()
+    stack = game.states[0].stack
+
+    parts = [HEADER.pack(MAGIC, seed, len(game.players), len(stack),
+                         len(board.tile_ids), len(steps))]
+
+    parts.append(bytes(NONE if game.yields[t] is None
+                       else Resources.KEYS.index(game.yields[t])
+                       for t in board.tile_ids))
+    parts.append(bytes(game.rolls[t] or 0 for t in board.tile_ids))
+    parts.append(bytes(CARDS.index(c) for c in stack))
+
+    for player in game.players:
+        is_bot = isinstance(player, Bot)
+        name = player.name.encode()
+        strategy = (player.strategy if is_bot else "").encode()
+        if len(name) > 255 or len(strategy) > 255:
+            raise RuntimeError("player name or strategy over 255 bytes")
+        parts.append(PLAYER.pack(is_bot, len(name), len(strategy)))
+        parts.append(name + strategy)
+
+    parts.append(bytes(-sum(len(p) for p in parts) % RECORD.size))
+
+    for action, (actor, option, argument, outcomes) in steps:
+        if argument is None:
+            kind, code = ARG_NONE, 0
+        elif isinstance(argument, str):
+            kind, code = ARG_STR, argument_codes[argument]
+        else:
+            kind, code = ARG_INT, argument
+        roll = next((o for o in outcomes if isinstance(o, int)), 0)
+        stolen = next((Resources.KEYS.index(o) for o in outcomes
+                       if isinstance(o, str)), NONE)
+        parts.append(RECORD.pack(actor, ACTIONS.index(action),
+                                 OPTIONS.index(option), kind, code,
+                                 roll, stolen))
+
+    return b''.join(parts)
+
+
+class ArchiveWriter:
+
+    def __init__(self, path: str):
+
+        self.data_file = open(path, 'ab')
+        self.index_file = open(path + '.idx', 'ab')
+
+    def append(self, game: Game, seed: int = 0) -> int:
+
+        block = encode_game(game, seed)
+
+        fcntl.flock(self.index_file, fcntl.LOCK_EX)
+        try:
+            offset = os.fstat(self.data_file.fileno()).st_size
+            self.data_file.write(block)
+            self.data_file.flush()
+            self.index_file.write(INDEX.pack(offset))
+            self.index_file.flush()
+            index_size = os.fstat(self.index_file.fileno()).st_size
+        finally:
+            fcntl.flock(self.index_file, fcntl.LOCK_UN)
+
+        return index_size // INDEX.size - 1
+
+    def close(self):
+
+        self.data_file.close()
+        self.index_file.close()
+
+    def __enter__(self) -> ArchiveWriter:
+
+        return self
+
+    def __exit__(self, *exc_info):
+
+        self.close()
+
+
+class ArchiveHeader:
+
+    def __init__(self, view: memoryview):
+
+        magic, seed, player_count, stack_count, tile_count, record_count = \
+            HEADER.unpack_from(view)
+        assert magic == MAGIC, magic
+
+        self.seed = seed
+        self.player_count = player_count
+        self.record_count = record_count
+        self.view = view
+
+        offset = HEADER.size
+        self.yield_codes = view[offset:offset + tile_count]
+        offset += tile_count
+        self.roll_codes = view[offset:offset + tile_count]
+        offset += tile_count
+        self.stack_codes = view[offset:offset + stack_count]
+        offset += stack_count
+
+        self.player_entries: list[tuple[int, str, str]] = []
+        for _ in range(player_count):
+            is_bot, name_size, strategy_size = PLAYER.unpack_from(view, offset)
+            offset += PLAYER.size
+            name = str(view[offset:offset + name_size], 'utf-8')
+            offset += name_size
+            strategy = str(view[offset:offset + strategy_size], 'utf-8')
+            offset += strategy_size
+            self.player_entries.append((is_bot, name, strategy))
+
+        self.size = offset + (-offset % RECORD.size)
+
+    def get_players(self) -> list[Player]:
+
+        return [Bot(name, strategy) if is_bot else Human(name)
+                for is_bot, name, strategy in self.player_entries]
+
+    def get_yields(self) -> list[str | None]:
+
+        return [None if c == NONE else Resources.KEYS[c]
+                for c in self.yield_codes]
+
+    def get_rolls(self) -> list[int | None]:
+
+        return [c or None for c in self.roll_codes]
+
+    def get_stack(self) -> list[str]:
+
+        return [CARDS[c] for c in self.stack_codes]
+
+
+class Archive:
+
+    def __init__(self, path: str):
+
+        self.path = path
+        self.data = self.map_file(path)
+        self.index = self.map_file(path + '.idx')
+        self.offsets = memoryview(self.index).cast('Q')
+
+    @staticmethod
+    def map_file(path: str) -> mmap.mmap | bytes:
+
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+
+        return len(self.offsets)
+
+    def get_block(self, game_index: int) -> memoryview:
+
+        start = self.offsets[game_index]
+        if game_index + 1 < len(self.offsets):
+            end = self.offsets[game_index + 1]
+        else:
+            end = len(self.data)
+        return memoryview(self.data)[start:end]
+
+    def get_header(self, game_index: int) -> ArchiveHeader:
+
+        return ArchiveHeader(self.get_block(game_index))
+
+    def get_records(self, game_index: int) -> memoryview:
+
+        block = self.get_block(game_index)
+        header = ArchiveHeader(block)
+        end = header.size + header.record_count * RECORD.size
+        return block[header.size:end]
+
+    def get_column(self, game_index: int, field: str) -> memoryview:
+
+        item_format, position = RECORD_COLUMNS[field]
+        records = self.get_records(game_index).cast(item_format)
+        return records[position::RECORD.size // records.itemsize]
+
+    def iter_records(self, game_index: int) -> Iterator[tuple]:
+
+        return RECORD.iter_unpack(self.get_records(game_index))
+
+    def scan(self) -> Iterator[tuple[int, memoryview]]:
+
+        for game_index in range(len(self)):
+            yield game_index, self.get_records(game_index)
+
+    def load_game(self,
+                  game_index: int,
+                  board: Board = STANDARD_BOARD,
+                  ) -> Game:
+
+        header = self.get_header(game_index)
+        argument_keys = get_argument_keys(board)
+
+        players = header.get_players()
+        with METRICS.pause():
+            game = Game(players, randomize_map=False, board=board)
+        robber = game.set_layout(header.get_yields(), header.get_rolls())
+        game.states = [GameState(len(players), header.get_stack(),
+                                 robber, board)]
+
+        records: list[tuple] = []
+        for actor, _, option, kind, code, roll, stolen in \
+                self.iter_records(game_index):
+            argument: int | str | None = None
+            if kind == ARG_INT:
+                argument = code
+            elif kind == ARG_STR:
+                argument = argument_keys[code]
+            outcomes: list[int | str] = []
+            if roll > 0:
+                outcomes.append(roll)
+            if stolen != NONE:
+                outcomes.append(Resources.KEYS[stolen])
+            records.append((actor, OPTIONS[option], argument, outcomes))
+
+        Action(game, 0).apply_many(records, trusted=True, commit_all=True)
+        return game
+
+    def close(self):
+
+        self.offsets.release()
+        for mapping in [self.data, self.index]:
+            if isinstance(mapping, mmap.mmap):
+                mapping.close()
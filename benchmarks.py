@@ -0,0 +1,45 @@
+from __future__ import annotations
+import random
+import time
+
+from .state import Game, Bot
+from .board import Board, STANDARD_BOARD, compile_board
+from .bots import run_bots
+
+
+BOARDS = {
+    19: (STANDARD_BOARD, 4),
+    30: (compile_board([3, 4, 5, 6, 5, 4, 3]), 6),
+    91: (compile_board([6, 7, 8, 9, 10, 11, 10, 9, 8, 7, 6]), 6),
+    127: (compile_board([7, 8, 9, 10, 11, 12, 13, 12, 11, 10, 9, 8, 7]), 6),
+}
+
+
+def measure_board(board: Board, player_count: int, game_count: int) -> float:
+
+    action_count = 0
+    duration = 0.0
+
+    for seed in range(game_count):
+        random.seed(seed)
+        players = [Bot(f"Bot{i}", 'default') for i in range(player_count)]
+        game = Game(players, board=board)
+        start = time.perf_counter()
+        run_bots(game)
+        duration += time.perf_counter() - start
+        action_count += len(game.states) - 1
+
+    return duration / action_count
+
+
+def run_benchmarks(game_count: int = 10):
+
+    for tile_count, (board, player_count) in BOARDS.items():
+        seconds = measure_board(board, player_count, game_count)
+        print(f"{tile_count:>3} tiles, {player_count} players: "
+              f"{seconds * 1000:.3f} ms/action")
+
+
+if __name__ == '__main__':
+
+    run_benchmarks()
@@ -235,11 +235,23 @@ EDGE_NODES = {
     "E3e": ["E3E", "E3F"],
 }
 
-NEIGHBORS = {n: {e: [t for t in EDGE_NODES[e] if t != n][0] for e in es}
-             for n, es in NODE_EDGES.items()}
+SPIRAL_TILE_IDS = [
+    'A3', 'A2', 'A1', 'B1', 'C1', 'D1', 'E1', 'E2', 'E3', 'D4',
+    'C5', 'B4', 'B3', 'B2', 'C2', 'D2', 'D3', 'C4', 'C3',
+]
 
-CONNECTIONS = {e: {n: [t for t in NODE_EDGES[n] if t != e] for n in ns}
-             for e, ns in EDGE_NODES.items()}
+BEGINNER_YIELDS = [
+    "R4", "R3", "R0", "R1", "R4", "R3", "R3", "R2", "R1", "R0",
+    "R2", "R2", "R1", "R3", "R0", "R2", "R4", "R0", None,
+]
+
+BEGINNER_ROLLS = [
+    10, 2, 9, 10, 8, 5, 11, 6, 5, 8, 9, 12, 6, 4, 3, 4, 3, 11, None,
+]
+
+VARIABLE_ROLLS: list[int | None] = [
+    5, 2, 6, 3, 8, 10, 9, 12, 11, 4, 8, 10, 9, 4, 5, 6, 3, 11
+]
 
 GENERIC_HARBORS = ["A3B", "A3C", "C1A", "C1D", "E2D", "E2E", "E3E", "E3F"]
 
@@ -251,65 +263,330 @@ SPECIFIC_HARBORS = {
     "R4": ["B1A", "B1B"],
 }
 
-HARBORS = GENERIC_HARBORS + [n for ns in SPECIFIC_HARBORS.values() for n in ns]
+HARBOR_KEYS = [None, "R2", None, "R0", "R1", None, "R3", "R4", None]
 
+ROLL_CHANCES = {roll: (6 - abs(7 - roll)) / 36 for roll in range(2, 13)}
 
-def get_shortest_paths(origin_node_id: str,
-                    only_edge_ids: set[str] | None = None,
-                    ) -> dict[str, list[str]]:
 
-    if only_edge_ids is None:
-        only_edge_ids = set(EDGE_NODES)
+COMPILED_BOARDS: dict[tuple, Board] = {}
 
-    paths: dict[str, list[str]] = {origin_node_id: []}
-    frontier: set[str] = {origin_node_id}
 
-    while len(frontier) > 0:
+class Board:
 
-        new_frontier: set[str] = set()
-        for node_id in frontier:
-            path = paths[node_id]
+    compile_args: tuple | None = None  # set by compile_board
 
-            for edge_id, next_node_id in NEIGHBORS[node_id].items():
-                if edge_id not in only_edge_ids:
-                    continue
-                if next_node_id in paths:
-                    continue
-                paths[next_node_id] = path + [edge_id]
-                new_frontier.add(next_node_id)
+    def __init__(self,
+                 tile_nodes: dict[str, list[str]],
+                 node_tiles: dict[str, list[str]],
+                 node_edges: dict[str, list[str]],
+                 edge_nodes: dict[str, list[str]],
+                 generic_harbors: list[str],
+                 specific_harbors: dict[str, list[str]],
+                 tile_ids: list[str],
+                 yields: list[str | None],
+                 rolls: list[int | None],
+                 variable_rolls: list[int | None],
+                 ):
+
+        self.tile_nodes = tile_nodes
+        self.node_tiles = node_tiles
+        self.node_edges = node_edges
+        self.edge_nodes = edge_nodes
+
+        self.tile_ids = tile_ids
+        self.node_ids = list(node_edges)
+        self.edge_ids = list(edge_nodes)
+
+        self.yields = yields
+        self.rolls = rolls
+        self.variable_rolls = variable_rolls
+
+        self.neighbors = {
+            n: {e: [t for t in edge_nodes[e] if t != n][0] for e in es}
+            for n, es in node_edges.items()}
+
+        self.connections = {
+            e: {n: [t for t in node_edges[n] if t != e] for n in ns}
+            for e, ns in edge_nodes.items()}
+
+        self.generic_harbors = generic_harbors
+        self.specific_harbors = specific_harbors
+        self.harbors = generic_harbors + [
+            n for ns in specific_harbors.values() for n in ns]
+
+        self.harbor_resources: dict[str, str | None] = {
+            n: None for n in generic_harbors}
+        self.harbor_resources.update(
+            {n: r for r, ns in specific_harbors.items() for n in ns})
+
+        self.node_distances: dict[str, dict[str, int]] = {}
+        self.next_edges: dict[str, dict[str, str]] = {}
+
+        for node_id in self.node_ids:
+            paths = self.get_shortest_paths(node_id)
+            self.node_distances[node_id] = {
+                n: len(p) for n, p in paths.items()}
+            self.next_edges[node_id] = {
+                n: p[0] for n, p in paths.items() if len(p) > 0}
 
-        frontier = new_frontier
+    def __deepcopy__(self, memo: dict) -> Board:
 
-    return paths
+        return self
 
+    def __reduce__(self):
 
-def get_max_road_length(player_roads: set[str],
-                        other_camps: set[str]) -> int:
+        if self is STANDARD_BOARD:
+            return 'STANDARD_BOARD'
+        if self.compile_args is not None:
+            return compile_board, self.compile_args
+        return Board, (self.tile_nodes, self.node_tiles, self.node_edges,
+                       self.edge_nodes, self.generic_harbors,
+                       self.specific_harbors, self.tile_ids, self.yields,
+                       self.rolls, self.variable_rolls)
 
-    waypoints = {n for e in player_roads for n in EDGE_NODES[e]}
-    max_length = 0
+    def get_shortest_paths(self,
+                           origin_node_id: str,
+                           only_edge_ids: set[str] | None = None,
+                           ) -> dict[str, list[str]]:
 
-    for start_node_id in waypoints:
-        paths = get_shortest_paths(start_node_id, player_roads)
-        for end_node_id in waypoints:
-            if end_node_id == start_node_id:
-                continue
-            path = paths.get(end_node_id)
-            if path is None:
-                continue
-            length = len(path)
-            if length <= max_length:
-                continue
+        paths: dict[str, list[str]] = {origin_node_id: []}
+        frontier: set[str] = {origin_node_id}
 
-            interrupted = False
-            interim_node_id = start_node_id
-            for edge_id in path[:-1]:
-                interim_node_id = NEIGHBORS[interim_node_id][edge_id]
-                if interim_node_id in other_camps:
-                    interrupted = True
-                    break
+        while len(frontier) > 0:
 
-            if not interrupted:
-                max_length = length
+            new_frontier: set[str] = set()
+            for node_id in frontier:
+                path = paths[node_id]
+
+                for edge_id, next_node_id in self.neighbors[node_id].items():
+                    if only_edge_ids is not None:
+                        if edge_id not in only_edge_ids:
+                            continue
+                    if next_node_id in paths:
+                        continue
+                    paths[next_node_id] = path + [edge_id]
+                    new_frontier.add(next_node_id)
+
+            frontier = new_frontier
+
+        return paths
+
+    def get_distances(self,
+                      origin_node_ids: set[str],
+                      blocked_edge_ids: set[str] | None = None,
+                      blocked_node_ids: set[str] | None = None,
+                      ) -> dict[str, int]:
+
+        if blocked_edge_ids is None:
+            blocked_edge_ids = set()
+        if blocked_node_ids is None:
+            blocked_node_ids = set()
+
+        distances = {n: 0 for n in origin_node_ids}
+        frontier = list(origin_node_ids)
+        distance = 0
+
+        while len(frontier) > 0:
+
+            distance += 1
+            new_frontier: list[str] = []
+            for node_id in frontier:
+                if node_id in blocked_node_ids:
+                    continue
+
+                for edge_id, next_node_id in self.neighbors[node_id].items():
+                    if edge_id in blocked_edge_ids:
+                        continue
+                    if next_node_id in distances:
+                        continue
+                    distances[next_node_id] = distance
+                    new_frontier.append(next_node_id)
+
+            frontier = new_frontier
+
+        return distances
+
+    def get_max_road_length(self,
+                            player_roads: set[str],
+                            other_camps: set[str]) -> int:
+
+        waypoints = {n for e in player_roads for n in self.edge_nodes[e]}
+        max_length = 0
+
+        for start_node_id in waypoints:
+            paths = self.get_shortest_paths(start_node_id, player_roads)
+            for end_node_id in waypoints:
+                if end_node_id == start_node_id:
+                    continue
+                path = paths.get(end_node_id)
+                if path is None:
+                    continue
+                length = len(path)
+                if length <= max_length:
+                    continue
 
-    return max_length
\ No newline at end of file
+                interrupted = False
+                interim_node_id = start_node_id
+                for edge_id in path[:-1]:
+                    interim_node_id = self.neighbors[interim_node_id][edge_id]
+                    if interim_node_id in other_camps:
+                        interrupted = True
+                        break
+
+                if not interrupted:
+                    max_length = length
+
+        return max_length
+
+    def get_coast(self) -> list[str]:
+
+        coast_edge_ids = [e for e, ns in self.edge_nodes.items()
+                          if len(set(self.node_tiles[ns[0]])
+                                 & set(self.node_tiles[ns[1]])) == 1]
+
+        coast_edges: dict[str, list[str]] = {}
+        for edge_id in coast_edge_ids:
+            for node_id in self.edge_nodes[edge_id]:
+                coast_edges.setdefault(node_id, []).append(edge_id)
+
+        edge_id = coast_edge_ids[0]
+        node_id = self.edge_nodes[edge_id][1]
+        coast = [edge_id]
+
+        while True:
+            edge_id = [e for e in coast_edges[node_id] if e != edge_id][0]
+            if edge_id == coast[0]:
+                return coast
+            coast.append(edge_id)
+            node_id = [n for n in self.edge_nodes[edge_id] if n != node_id][0]
+
+
+def get_row_label(row: int) -> str:
+
+    label = ""
+    row += 1
+    while row > 0:
+        row, rest = divmod(row - 1, 26)
+        label = chr(ord('A') + rest) + label
+    return label
+
+
+def compile_board(row_sizes: list[int],
+                  harbor_keys: list[str | None] | None = None,
+                  ) -> Board:
+
+    key = (tuple(row_sizes), harbor_keys and tuple(harbor_keys))
+    if key in COMPILED_BOARDS:
+        return COMPILED_BOARDS[key]
+
+    assert len(row_sizes) > 0, row_sizes
+    for size, next_size in zip(row_sizes, row_sizes[1:]):
+        assert abs(size - next_size) == 1, row_sizes
+
+    labels = [get_row_label(r) for r in range(len(row_sizes))]
+    tile_rows = [[f"{labels[r]}{i + 1}" for i in range(size)]
+                 for r, size in enumerate(row_sizes)]
+
+    lines: list[list[str]] = []
+    for row, tile_ids in enumerate(tile_rows):
+        top_ids = [t + k for t in tile_ids for k in "AB"]
+        top_ids.append(tile_ids[-1] + "C")
+        if row > 0 and row_sizes[row - 1] > row_sizes[row]:
+            upper_ids = tile_rows[row - 1]
+            top_ids = [upper_ids[0] + "D"] + top_ids + [upper_ids[-1] + "F"]
+        lines.append(top_ids)
+    bottom_ids = tile_rows[-1]
+    lines.append([t + k for t in bottom_ids for k in "DE"]
+                 + [bottom_ids[-1] + "F"])
+
+    tile_nodes: dict[str, list[str]] = {}
+    edge_nodes: dict[str, list[str]] = {}
+
+    for line in lines:
+        for node_id, next_node_id in zip(line, line[1:]):
+            kind = node_id[-1]
+            if kind == "C":
+                edge_id = next_node_id[:-1] + "e"
+            else:
+                edge_id = node_id[:-1] + {"A": "b", "B": "c"}.get(
+                    kind, kind.lower())
+            edge_nodes[edge_id] = [node_id, next_node_id]
+
+    for row, tile_ids in enumerate(tile_rows):
+        top_line = lines[row]
+        bottom_line = lines[row + 1]
+        top = (len(top_line) - 2 * len(tile_ids) - 1) // 2
+        bottom = (len(bottom_line) - 2 * len(tile_ids) - 1) // 2
+
+        for i, tile_id in enumerate(tile_ids):
+            top_ids = top_line[top + 2 * i:top + 2 * i + 3]
+            bottom_ids = bottom_line[bottom + 2 * i:bottom + 2 * i + 3]
+            tile_nodes[tile_id] = top_ids + bottom_ids[::-1]
+            edge_nodes[tile_id + "a"] = [bottom_ids[0], top_ids[0]]
+
+        last = len(tile_ids) * 2
+        edge_nodes[tile_ids[-1] + "f"] = [
+            bottom_line[bottom + last], top_line[top + last]]
+
+    node_tiles: dict[str, list[str]] = {}
+    node_edges: dict[str, list[str]] = {}
+    for line in lines:
+        for node_id in line:
+            node_tiles[node_id] = []
+            node_edges[node_id] = []
+    for tile_id, node_ids in tile_nodes.items():
+        for node_id in node_ids:
+            node_tiles[node_id].append(tile_id)
+    for edge_id, node_ids in edge_nodes.items():
+        for node_id in node_ids:
+            node_edges[node_id].append(edge_id)
+
+    tile_ids = [t for ts in tile_rows for t in ts]
+    desert_count = max(1, round(len(tile_ids) / len(SPIRAL_TILE_IDS)))
+    yield_count = len(tile_ids) - desert_count
+
+    res_keys = [r for r in BEGINNER_YIELDS if r is not None]
+    yields = [res_keys[i % len(res_keys)] for i in range(yield_count)]
+    variable_rolls = [VARIABLE_ROLLS[i % len(VARIABLE_ROLLS)]
+                      for i in range(yield_count)]
+
+    board = Board(tile_nodes, node_tiles, node_edges, edge_nodes, [], {},
+                  tile_ids, yields + [None] * desert_count,
+                  variable_rolls + [None] * desert_count, variable_rolls)
+
+    coast = board.get_coast()
+    if harbor_keys is None:
+        harbor_count = round(len(coast) * len(HARBOR_KEYS) / 30)
+        harbor_keys = [HARBOR_KEYS[i % len(HARBOR_KEYS)]
+                       for i in range(harbor_count)]
+
+    for index, res_key in enumerate(harbor_keys):
+        edge_id = coast[index * len(coast) // len(harbor_keys)]
+        for node_id in edge_nodes[edge_id]:
+            if res_key is None:
+                board.generic_harbors.append(node_id)
+            else:
+                board.specific_harbors.setdefault(res_key, []).append(node_id)
+            board.harbors.append(node_id)
+            board.harbor_resources[node_id] = res_key
+
+    board.compile_args = (list(row_sizes), list(harbor_keys))
+    COMPILED_BOARDS[key] = board
+    COMPILED_BOARDS[tuple(row_sizes), tuple(harbor_keys)] = board
+    return board
+
+
+STANDARD_BOARD = Board(TILE_NODES, NODE_TILES, NODE_EDGES, EDGE_NODES,
+                       GENERIC_HARBORS, SPECIFIC_HARBORS, SPIRAL_TILE_IDS,
+                       BEGINNER_YIELDS, BEGINNER_ROLLS, VARIABLE_ROLLS)
+
+NEIGHBORS = STANDARD_BOARD.neighbors
+CONNECTIONS = STANDARD_BOARD.connections
+HARBORS = STANDARD_BOARD.harbors
+HARBOR_RESOURCES = STANDARD_BOARD.harbor_resources
+NODE_DISTANCES = STANDARD_BOARD.node_distances
+NEXT_EDGES = STANDARD_BOARD.next_edges
+
+get_shortest_paths = STANDARD_BOARD.get_shortest_paths
+get_distances = STANDARD_BOARD.get_distances
+get_max_road_length = STANDARD_BOARD.get_max_road_length
@@ -1,17 +1,42 @@
 from __future__ import annotations
-from typing import Callable, Any
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Any
+import asyncio
 import random
+import threading
+import time
 
-from .state import Game, Bot, Resources
+from .state import Game, GameState, Bot, Resources, ConflictError
 from .actions import Action
+from .production import rank_robber_targets
 from .board import *
+from .metrics import METRICS
 
 
-def run_bots(game: Game):
+def run_bots(game: Game,
+             time_budget: float | None = None,
+             decision_budget: float | None = None,
+             ) -> list[int]:
+
+    start = time.perf_counter()
+    try:
+        return run_bots_until(game, time_budget, decision_budget)
+    finally:
+        METRICS.observe('catan_run_bots_seconds', time.perf_counter() - start)
+
+
+def run_bots_until(game: Game,
+                   time_budget: float | None,
+                   decision_budget: float | None,
+                   ) -> list[int]:
 
-    strat_classes = {'default': DefaultStrategy}
     changed = True
 
+    deadline = None
+    if time_budget is not None:
+        deadline = time.monotonic() + time_budget
+
     while changed:
 
         changed = False
@@ -21,21 +46,139 @@ def run_bots(game: Game):
             if not isinstance(player, Bot):
                 continue
 
-            strategy_class = strat_classes[player.strategy]
-
             while True:
-                strategy = strategy_class(game, index)
-                if strategy.run():
+                if deadline is not None and time.monotonic() >= deadline:
+                    return get_pending_bots(game)
+                if run_bot(game, index, decision_budget):
                     changed = True
                 else:
                     break
 
+    return []
+
+
+def run_bot(game: Game,
+            player_index: int,
+            decision_budget: float | None = None,
+            ) -> bool:
+
+    player = game.players[player_index]
+    assert isinstance(player, Bot), player
+
+    strategy_class = STRATEGIES[player.strategy]
+    strategy = strategy_class(game, player_index, decision_budget)
+    try:
+        moved = strategy.run()
+    except ConflictError:
+        return True
+
+    if moved:
+        METRICS.increment('catan_bot_decisions_total')
+    return moved
+
+
+def get_pending_bots(game: Game) -> list[int]:
+
+    state = game.states[-1]
+    return [i for i, p in enumerate(game.players)
+            if isinstance(p, Bot) and state.players[i].choice is not None]
+
+
+class BotDriver:
+
+    def __init__(self, max_workers: int = 4):
+
+        self.executor = ThreadPoolExecutor(max_workers)
+        self.semaphore = asyncio.Semaphore(max_workers)
+
+    async def run(self,
+                  game: Game,
+                  decision_budget: float | None = None,
+                  ) -> AsyncIterator[GameState]:
+
+        loop = asyncio.get_running_loop()
+        changed = True
+
+        while changed:
+
+            changed = False
+
+            for index, player in enumerate(game.players):
+
+                if not isinstance(player, Bot):
+                    continue
+
+                while True:
+                    async with self.semaphore:
+                        moved = await loop.run_in_executor(
+                            self.executor, run_bot, game, index,
+                            decision_budget)
+                    if not moved:
+                        break
+                    changed = True
+                    yield game.states[-1]
+
+    async def run_all(self,
+                      game: Game,
+                      decision_budget: float | None = None):
+
+        async for _ in self.run(game, decision_budget):
+            pass
+
+    def shutdown(self):
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class TranspositionTable:
+
+    def __init__(self, capacity: int):
+
+        self.capacity = capacity
+        self.entries: OrderedDict[int, tuple[int, Any]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+
+        return len(self.entries)
+
+    def get(self, key: int, min_depth: int = 0) -> Any | None:
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+
+        depth, value = entry
+        if depth < min_depth:
+            return None
+        return value
+
+    def put(self, key: int, value: Any, depth: int = 0):
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= depth:
+                self.entries[key] = (depth, value)
+            self.entries.move_to_end(key)
+
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
 
 class Strategy:
 
+    TABLE = TranspositionTable(1 << 16)
+
     BASE_LEVELS = {'R0': 1, 'R1': 1, 'R2': 2, 'R3': 1, 'R4': 3}
 
-    def __init__(self, game: Game, player_index: int):
+    BOOK: Any = None  # openings.OpeningBook consulted in the base phases
+
+    def __init__(self,
+                 game: Game,
+                 player_index: int,
+                 time_budget: float | None = None):
 
         self.game = game
         self.index = player_index
@@ -45,11 +188,20 @@ class Strategy:
 
         self.options: dict[str, list] = {}
 
+        self.deadline = None
+        if time_budget is not None:
+            self.deadline = time.monotonic() + time_budget
+
+    def is_expired(self) -> bool:
+
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
     def run(self) -> bool:
 
         choice = self.player.choice
         if choice is None:
             return False
+        choice.resolve(self.state)
         self.options.clear()
         for option in choice.options:
             self.options[option] = choice.option_args.get(option, [])
@@ -64,36 +216,43 @@ class Strategy:
 
         action = Action(self.game, self.index)
 
+        version = self.state.version
+
         values = self.options[option]
         if len(values) == 0:
-            action.choose(option)
+            action.choose(option, version=version)
             return True
 
         if rank is not None:
-            ranking = {v: rank(v) for v in values}
+            ranking: dict[Any, int] = {}
+            for value in values:
+                ranking[value] = rank(value)
+                if self.is_expired():
+                    break
             top_rank = max(ranking.values())
             if min_rank and top_rank < min_rank:
                 return False
             values = [v for v, r in ranking.items() if r == top_rank]
 
         chosen_value = random.choice(values)
-        action.choose(option, chosen_value)
+        action.choose(option, chosen_value, version)
         return True
 
 
 class DefaultStrategy(Strategy):
 
-    def __init__(self, game: Game, player_index: int):
-
-        super().__init__(game, player_index)
-
-        self.camp_options = set(self.state.get_basecamp_options())
+    PARAMS = {
+        'card_points': 5,
+        'card_multi_points': 3,
+        'trade_resources': 6,
+        'swap_min_rank': 1,
+    }
 
     def rank_camp_option(self, node_id: str) -> int:
 
         yield_set: set[str] = set()
         score = 0
-        for tile_id in NODE_TILES[node_id]:
+        for tile_id in self.game.board.node_tiles[node_id]:
             res_key = self.game.yields[tile_id]
             if res_key is None:
                 continue
@@ -102,14 +261,15 @@ class DefaultStrategy(Strategy):
             else:
                 score += 2
                 yield_set.add(res_key)
-        if node_id in HARBORS:
+        if node_id in self.game.board.harbor_resources:
             score += 1
         return score
 
     def rank_road_option(self, edge_id: str) -> int:
 
         unlocked_node_id = ""
-        for node_id, con_edge_ids in CONNECTIONS[edge_id].items():
+        board = self.game.board
+        for node_id, con_edge_ids in board.connections[edge_id].items():
             if node_id in self.player.get_sites():
                 continue
             if not any(e in self.player.roads for e in con_edge_ids):
@@ -118,15 +278,15 @@ class DefaultStrategy(Strategy):
         if unlocked_node_id == "":  # connects two existing roads
             return 0
 
-        if unlocked_node_id in self.camp_options:
+        if self.state.is_free_site(unlocked_node_id):
             return self.rank_camp_option(unlocked_node_id) + 2
 
-        all_roads = {e for p in self.state.players for e in p.roads}
         score = 0
-        for next_edge_id, next_node_id in NEIGHBORS[unlocked_node_id].items():
-            if next_edge_id in all_roads:
+        neighbors = board.neighbors[unlocked_node_id]
+        for next_edge_id, next_node_id in neighbors.items():
+            if not self.state.is_free_edge(next_edge_id):
                 continue
-            if next_node_id not in self.camp_options:
+            if not self.state.is_free_site(next_node_id):
                 continue
             camp_score = self.rank_camp_option(next_node_id)
             if camp_score > score:
@@ -134,15 +294,6 @@ class DefaultStrategy(Strategy):
 
         return score
 
-    def rank_robber_option(self, tile_id: str) -> int:
-
-        owners = self.state.get_adjacent_owners(tile_id)
-        if self.index in owners.values():
-            return 0
-        if len(owners) == 0:
-            return 1
-        return 2
-
     def rank_lose_option(self, res_key: str) -> int:
 
         base_level = self.BASE_LEVELS[res_key]
@@ -155,21 +306,42 @@ class DefaultStrategy(Strategy):
 
     def rank_swap_option(self, res_key: str) -> int:
 
-        swap_rate = self.state.get_swap_rate(self.index, res_key)
+        swap_rate = self.player.swap_rates[res_key]
         excess = self.player.resources[res_key] - swap_rate
         base = self.BASE_LEVELS[res_key]
         return excess - base
 
+    def choose_base_camp(self, phase: str):
+
+        ranking = None
+        if self.BOOK is not None:
+            ranking = self.BOOK.get_ranking(self.game, phase,
+                                           self.index)
+
+        if ranking is None:
+            self.choose('camp', self.rank_camp_option)
+            return
+
+        def rank(node_id: str) -> int:
+            if node_id in ranking:
+                return 1000 + ranking[node_id]
+            return self.rank_camp_option(node_id)
+
+        self.choose('camp', rank)
+
     def base1(self, node_id: str):
 
         if node_id == "":
-            self.choose('camp', self.rank_camp_option)
+            self.choose_base_camp('base1')
         else:
             self.choose('road', self.rank_road_option)
 
-    def base2(self, item: str):
+    def base2(self, node_id: str):
 
-        self.base1(item)
+        if node_id == "":
+            self.choose_base_camp('base2')
+        else:
+            self.choose('road', self.rank_road_option)
 
     def select(self, dropped: int, drop_count: int, *drops):
 
@@ -181,7 +353,9 @@ class DefaultStrategy(Strategy):
 
     def move(self):
 
-        self.choose('robber', self.rank_robber_option)
+        targets = rank_robber_targets(self.game, self.state, self.index)
+        gains = {t.tile_id: t.gain for t in targets}
+        self.choose('robber', gains.__getitem__)
 
     def rob(self):
 
@@ -220,18 +394,23 @@ class DefaultStrategy(Strategy):
             res2 = self.player.resources["R2"]
             res3 = self.player.resources["R3"]
             has_multi = res2 > 1 and res3 > 1
-            if points > 5 or (has_multi and points > 3):
+            if points > self.PARAMS['card_points'] or (
+                    has_multi and points > self.PARAMS['card_multi_points']):
                 self.choose('card')
                 return
 
         if 'swap' in self.options:
-            if self.choose('swap', self.rank_swap_option, min_rank=1):
+            min_rank = self.PARAMS['swap_min_rank']
+            if self.choose('swap', self.rank_swap_option, min_rank=min_rank):
                 return
 
-        if self.player.resources.count() > 6:
+        if self.player.resources.count() > self.PARAMS['trade_resources']:
             last_trade_round = 0
             for state in reversed(self.game.states):
-                if state.actor == self.index and state.option == 'trade':
+                if state.round != self.state.round:
+                    break
+                if state.actor == self.index and (
+                        state.option == 'trade' or state.action == 'partner'):
                     last_trade_round = state.round
                     break
             if last_trade_round != self.state.round:
@@ -270,6 +449,14 @@ class DefaultStrategy(Strategy):
 
         self.choose('res', self.rank_gain_option)
 
+    def partner(self):
+
+        self.choose('cancel')
+
+    def donate(self, player_index: int, request_key: str):
+
+        self.choose('decline')
+
     def trade(self, player_index: int, request_key: str, offer_key: str, amount: int):
 
         if 'accept' not in self.options:
@@ -280,3 +467,6 @@ class DefaultStrategy(Strategy):
             self.choose('decline')
         else:
             self.choose('accept')
+
+
+STRATEGIES: dict[str, type[Strategy]] = {'default': DefaultStrategy}
@@ -0,0 +1,111 @@
+from __future__ import annotations
+import gzip
+import os
+import pickle
+import random
+import sys
+
+from .state import Game, Bot
+from .actions import Action
+from .board import STANDARD_BOARD, compile_board
+from .bots import run_bots
+from .memprof import MemoryReport, get_deep_size
+
+
+BOARDS = [STANDARD_BOARD, compile_board([3, 4, 5, 6, 5, 4, 3])]
+
+# saved with Game.save by the first release, one human seat waiting to move
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'fixtures',
+                             'baseline_game.pickle.gz')
+
+
+class PackageUnpickler(pickle.Unpickler):
+
+    def find_class(self, module: str, name: str):
+
+        if module.startswith('package.'):  # import path of the saving process
+            module = __package__ + module[len('package'):]
+        return super().find_class(module, name)
+
+
+def check_options(game_count: int = 40, seed: int = 0) -> int:
+
+    rng = random.Random(seed)
+    state_count = 0
+
+    for _ in range(game_count):
+        random.seed(rng.getrandbits(64))
+        board = rng.choice(BOARDS)
+        player_count = rng.randint(2, 4)
+        players = [Bot(f"Bot{i}", 'default') for i in range(player_count)]
+        game = Game(players, board=board)
+        run_bots(game)
+
+        for state in game.states:
+            state.verify_options()
+        state_count += len(game.states)
+
+    return state_count
+
+
+def check_saved_game(path: str = BASELINE_PATH) -> Game:
+
+    with gzip.open(path, 'rb') as file:
+        game: Game = PackageUnpickler(file).load()
+
+    for state in game.states:
+        state.verify_points()
+        state.verify_zobrist()
+        state.verify_options()
+
+    replay = game.restart()
+    Action(replay, 0).apply_many(game.get_records(), trusted=False,
+                                 commit_all=True)
+    assert replay.states[-1].zobrist == game.states[-1].zobrist
+
+    game.players = [Bot(p.name, 'default') for p in game.players]
+    run_bots(game)
+    assert game.states[-1].winner_index >= 0
+
+    return game
+
+
+def check_memory_report(seed: int = 0) -> MemoryReport:
+
+    random.seed(seed)
+    game = Game([Bot(f"Bot{i}", 'default') for i in range(3)])
+    run_bots(game)
+    report = MemoryReport(game)
+
+    seen: set[int] = set()
+    get_deep_size(game.board, seen)
+    for name, value in vars(game).items():
+        if name != 'states':
+            get_deep_size(value, seen)
+    choices = [p.choice for s in game.states for p in s.players]
+    expected = get_deep_size(choices, seen) - sys.getsizeof(choices)
+
+    # strings shared with the stacks may be counted there instead
+    assert abs(report.sizes['states.choices'] - expected) <= expected // 100
+
+    return report
+
+
+def run_checks(game_count: int = 40):
+
+    state_count = check_options(game_count)
+    print(f"road and camp options match in {state_count} states "
+          f"of {game_count} games")
+
+    game = check_saved_game()
+    print(f"saved baseline game loads, replays and finishes "
+          f"after {len(game.states)} states")
+
+    report = check_memory_report()
+    print(f"memory report counts {report.sizes['states.choices']:,} bytes "
+          f"of choices in {report.state_count} states")
+
+
+if __name__ == '__main__':
+
+    run_checks()
@@ -0,0 +1,419 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+import argparse
+import asyncio
+import json
+import random
+import resource
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from .state import Game, Human, Bot, ConflictError
+from .actions import Action
+from .bots import run_bots
+
+
+class LocalTarget:
+
+    def __init__(self):
+
+        self.games: dict[str, Game] = {}
+        self.lock = threading.Lock()
+
+    def create_game(self, human_count: int, bot_count: int) -> list[str]:
+
+        secret_keys = [secrets.token_hex(8) for _ in range(human_count)]
+        players = [Human(f"Human{i}", s) for i, s in enumerate(secret_keys)]
+        players += [Bot(f"Bot{i}", 'default') for i in range(bot_count)]
+        game = Game(players)
+
+        with self.lock:
+            for secret in secret_keys:
+                self.games[secret] = game
+
+        run_bots(game)
+        return secret_keys
+
+    def close_game(self, secret_keys: list[str]):
+
+        with self.lock:
+            for secret in secret_keys:
+                self.games.pop(secret, None)
+
+    def get_game(self, secret: str) -> tuple[Game, int]:
+
+        game = self.games[secret]
+        player_index = game.get_player_index(secret)
+        assert player_index is not None, secret
+        return game, player_index
+
+    def get_state(self, secret: str) -> tuple[int, dict]:
+
+        game, player_index = self.get_game(secret)
+        with game.lock:
+            state = game.states[-1]
+            return state.version, state.to_dict(player_index)
+
+    def choose(self,
+               secret: str,
+               option: str,
+               argument: int | str | None,
+               version: int | None):
+
+        game, player_index = self.get_game(secret)
+        Action(game, player_index).choose(option, argument, version)
+        run_bots(game)
+
+
+class HttpTarget:
+
+    def __init__(self, url: str, timeout: float = 10.0):
+
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, path: str, body: dict | None = None) -> Any:
+
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(
+            self.url + path, data, {'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as r:
+                return json.loads(r.read())
+        except urllib.error.HTTPError as error:
+            if error.code == 409:
+                raise ConflictError(error.read().decode()) from None
+            raise
+
+    def create_game(self, human_count: int, bot_count: int) -> list[str]:
+
+        body = {'humans': human_count, 'bots': bot_count}
+        return self.request('/games', body)['secrets']
+
+    def close_game(self, secret_keys: list[str]):
+
+        self.request('/games/close', {'secrets': secret_keys})
+
+    def get_state(self, secret: str) -> tuple[int, dict]:
+
+        response = self.request(f'/games/{secret}')
+        return response['version'], response['state']
+
+    def choose(self,
+               secret: str,
+               option: str,
+               argument: int | str | None,
+               version: int | None):
+
+        body = {'option': option, 'argument': argument, 'version': version}
+        self.request(f'/games/{secret}', body)
+
+
+def serve(target: LocalTarget,
+          port: int,
+          host: str = "127.0.0.1",
+          ) -> ThreadingHTTPServer:
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+
+            secret = self.path.rsplit('/', 1)[-1]
+            try:
+                version, state = target.get_state(secret)
+            except KeyError:
+                self.reply(404, {'error': secret})
+                return
+            self.reply(200, {'version': version, 'state': state})
+
+        def do_POST(self):
+
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length))
+
+            if self.path == '/games':
+                secret_keys = target.create_game(body['humans'], body['bots'])
+                self.reply(200, {'secrets': secret_keys})
+                return
+
+            if self.path == '/games/close':
+                target.close_game(body['secrets'])
+                self.reply(200, {})
+                return
+
+            secret = self.path.rsplit('/', 1)[-1]
+            try:
+                target.choose(secret, body['option'], body['argument'],
+                              body['version'])
+            except KeyError:
+                self.reply(404, {'error': secret})
+            except ConflictError as error:
+                self.reply(409, {'error': str(error)})
+            except AssertionError as error:
+                self.reply(400, {'error': str(error)})
+            else:
+                self.reply(200, {})
+
+        def reply(self, status: int, body: dict):
+
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def pick_random_move(choice_dict: dict,
+                     rng: random.Random,
+                     ) -> tuple[str, int | str | None] | None:
+
+    option_args = choice_dict['optionArgs']
+    moves: list[tuple[str, int | str | None]] = []
+
+    for option in choice_dict['options']:
+        args = option_args.get(option)
+        if args is None:
+            moves.append((option, None))
+        elif len(args) > 0:
+            moves.append((option, rng.choice(args)))
+
+    if len(moves) == 0:
+        return None
+    return rng.choice(moves)
+
+
+def get_memory_usage() -> int:
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class LoadReport:
+
+    PERCENTILES = [50, 90, 99]
+
+    def __init__(self):
+
+        self.latencies: dict[str, list[float]] = {
+            'create': [], 'state': [], 'choose': [], 'close': []}
+        self.action_count = 0
+        self.conflict_count = 0
+        self.error_count = 0
+        self.game_count = 0
+        self.finished_count = 0
+        self.duration = 0.0
+        self.memory: list[tuple[float, int]] = []
+
+    def get_percentiles(self, kind: str) -> dict[int, float]:
+
+        latencies = sorted(self.latencies[kind])
+        if len(latencies) == 0:
+            return {}
+        return {p: latencies[min(len(latencies) - 1,
+                                 len(latencies) * p // 100)]
+                for p in self.PERCENTILES}
+
+    def get_throughput(self) -> float:
+
+        if self.duration == 0:
+            return 0.0
+        return self.action_count / self.duration
+
+    def __str__(self) -> str:
+
+        lines = [
+            f"duration: {self.duration:.1f} s",
+            f"games: {self.game_count} started, "
+            f"{self.finished_count} finished",
+            f"actions: {self.action_count} "
+            f"({self.get_throughput():.1f}/s), "
+            f"{self.conflict_count} conflicts, {self.error_count} errors",
+        ]
+
+        for kind in self.latencies:
+            percentiles = self.get_percentiles(kind)
+            if len(percentiles) == 0:
+                continue
+            values = ", ".join(f"p{p} {s * 1000:.2f} ms"
+                               for p, s in percentiles.items())
+            lines.append(f"{kind}: {values}")
+
+        for elapsed, usage in self.memory:
+            lines.append(f"memory at {elapsed:6.1f} s: {usage} kB")
+
+        return "\n".join(lines)
+
+
+class LoadTest:
+
+    def __init__(self,
+                 target: LocalTarget | HttpTarget,
+                 game_count: int = 10,
+                 human_count: int = 2,
+                 bot_count: int = 2,
+                 think_time: float = 0.1,
+                 max_workers: int = 8,
+                 seed: int | None = None):
+
+        self.target = target
+        self.game_count = game_count
+        self.human_count = human_count
+        self.bot_count = bot_count
+        self.think_time = think_time
+        self.max_workers = max_workers
+        self.rng = random.Random(seed)
+
+        self.report = LoadReport()
+        self.deadline = 0.0
+
+    async def call(self, kind: str, method: Callable, *args) -> Any:
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self.executor, method, *args)
+        finally:
+            self.report.latencies[kind].append(time.perf_counter() - start)
+
+    async def think(self, rng: random.Random):
+
+        if self.think_time > 0:
+            await asyncio.sleep(rng.expovariate(1 / self.think_time))
+        else:
+            await asyncio.sleep(0)
+
+    async def play_human(self, secret: str, rng: random.Random) -> bool:
+
+        while time.monotonic() < self.deadline:
+
+            version, state = await self.call(
+                'state', self.target.get_state, secret)
+            if state['winner'] >= 0:
+                return True
+
+            player_dict = next(p for p in state['players']
+                               if 'resources' in p)
+
+            move = None
+            if 'choice' in player_dict:
+                move = pick_random_move(player_dict['choice'], rng)
+
+            await self.think(rng)
+            if move is None:
+                continue
+
+            option, argument = move
+            try:
+                await self.call('choose', self.target.choose, secret,
+                                option, argument, version)
+                self.report.action_count += 1
+            except ConflictError:
+                self.report.conflict_count += 1
+            except Exception:
+                self.report.error_count += 1
+
+        return False
+
+    async def play_games(self):
+
+        rng = random.Random(self.rng.random())
+
+        while time.monotonic() < self.deadline:
+
+            secret_keys = await self.call(
+                'create', self.target.create_game,
+                self.human_count, self.bot_count)
+            self.report.game_count += 1
+
+            players = [self.play_human(s, random.Random(rng.random()))
+                       for s in secret_keys]
+            finished = await asyncio.gather(*players)
+            if any(finished):
+                self.report.finished_count += 1
+
+            await self.call('close', self.target.close_game, secret_keys)
+
+    async def sample_memory(self, interval: float):
+
+        start = time.monotonic()
+        while time.monotonic() < self.deadline:
+            elapsed = time.monotonic() - start
+            self.report.memory.append((elapsed, get_memory_usage()))
+            await asyncio.sleep(interval)
+
+    async def run_async(self, duration: float) -> LoadReport:
+
+        self.executor = ThreadPoolExecutor(self.max_workers)
+        self.report = LoadReport()
+        self.deadline = time.monotonic() + duration
+
+        start = time.monotonic()
+        sampler = asyncio.create_task(self.sample_memory(duration / 10))
+        try:
+            await asyncio.gather(
+                *[self.play_games() for _ in range(self.game_count)])
+        finally:
+            self.report.duration = time.monotonic() - start
+            sampler.cancel()
+            self.executor.shutdown(wait=True)
+
+        elapsed = self.report.duration
+        self.report.memory.append((elapsed, get_memory_usage()))
+        return self.report
+
+    def run(self, duration: float) -> LoadReport:
+
+        return asyncio.run(self.run_async(duration))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="simulate concurrent players against the engine")
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--humans', type=int, default=2)
+    parser.add_argument('--bots', type=int, default=2)
+    parser.add_argument('--think', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--url', help="base URL of a running server")
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help="only run a local server on PORT")
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        server = serve(LocalTarget(), args.serve)
+        print(f"serving on port {args.serve}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+
+    target: LocalTarget | HttpTarget = LocalTarget()
+    if args.url is not None:
+        target = HttpTarget(args.url)
+
+    load_test = LoadTest(target, args.games, args.humans, args.bots,
+                         args.think, args.workers, args.seed)
+    print(load_test.run(args.duration))
+
+
+if __name__ == '__main__':
+
+    main()
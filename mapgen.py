@@ -0,0 +1,125 @@
+from __future__ import annotations
+from typing import Iterator
+import random
+
+from .board import Board, STANDARD_BOARD, ROLL_CHANCES
+
+
+WEIGHTS = {
+    'resource_pips': 1.0,   # spread of average pips per resource tile
+    'hot_pairs': 4.0,       # adjacent tiles that both roll 6 or 8
+    'same_rolls': 2.0,      # adjacent tiles with the same roll
+    'same_yields': 0.5,     # adjacent tiles with the same resource
+    'node_pips': 0.5,       # pips of the richest node above the average
+    'harbor_pips': 0.25,    # own-resource pips next to 2:1 harbors
+}
+
+HOT_ROLLS = [6, 8]
+
+
+class LayoutScorer:
+
+    def __init__(self, board: Board, weights: dict[str, float] = WEIGHTS):
+
+        self.board = board
+        self.weights = weights
+
+        tile_indices = {t: i for i, t in enumerate(board.tile_ids)}
+
+        self.tile_pairs: list[tuple[int, int]] = []
+        for a, tile_a in enumerate(board.tile_ids):
+            for tile_b in board.tile_ids[a + 1:]:
+                shared = set(board.tile_nodes[tile_a]) & set(
+                    board.tile_nodes[tile_b])
+                if len(shared) == 2:
+                    self.tile_pairs.append((a, tile_indices[tile_b]))
+
+        self.node_tiles = [[tile_indices[t] for t in board.node_tiles[n]]
+                           for n in board.node_ids]
+
+        self.harbor_tiles: list[tuple[str, list[int]]] = []
+        for node_id, res_key in board.harbor_resources.items():
+            if res_key is not None:
+                self.harbor_tiles.append((res_key, [
+                    tile_indices[t] for t in board.node_tiles[node_id]]))
+
+    def score(self,
+              yields: list[str | None],
+              rolls: list[int | None],
+              ) -> float:
+
+        pips = [0 if r is None else round(ROLL_CHANCES[r] * 36)
+                for r in rolls]
+
+        resource_pips: dict[str, list[int]] = {}
+        for res_key, tile_pips in zip(yields, pips):
+            if res_key is not None:
+                resource_pips.setdefault(res_key, []).append(tile_pips)
+        averages = [sum(p) / len(p) for p in resource_pips.values()]
+        mean = sum(averages) / len(averages)
+        pip_spread = sum((a - mean) ** 2 for a in averages) / len(averages)
+
+        hot_pairs = 0
+        same_rolls = 0
+        same_yields = 0
+        for a, b in self.tile_pairs:
+            if rolls[a] in HOT_ROLLS and rolls[b] in HOT_ROLLS:
+                hot_pairs += 1
+            if rolls[a] is not None and rolls[a] == rolls[b]:
+                same_rolls += 1
+            if yields[a] is not None and yields[a] == yields[b]:
+                same_yields += 1
+
+        node_pips = [sum(pips[t] for t in ts) for ts in self.node_tiles]
+        node_excess = max(node_pips) - sum(node_pips) / len(node_pips)
+
+        harbor_pips = 0
+        for res_key, tile_indices in self.harbor_tiles:
+            harbor_pips += sum(pips[t] for t in tile_indices
+                               if yields[t] == res_key)
+
+        weights = self.weights
+        return (weights['resource_pips'] * pip_spread
+                + weights['hot_pairs'] * hot_pairs
+                + weights['same_rolls'] * same_rolls
+                + weights['same_yields'] * same_yields
+                + weights['node_pips'] * node_excess
+                + weights['harbor_pips'] * harbor_pips)
+
+
+def sample_layout(board: Board,
+                  rng: random.Random,
+                  ) -> tuple[list[str | None], list[int | None]]:
+
+    yields = list(board.yields)
+    rolls = [r for r in board.variable_rolls if r is not None]
+    rng.shuffle(yields)
+    rng.shuffle(rolls)
+    for index, res_key in enumerate(yields):
+        if res_key is None:
+            rolls.insert(index, None)
+    return yields, rolls
+
+
+def iter_layouts(board: Board = STANDARD_BOARD,
+                 seed: int | None = None,
+                 candidate_count: int = 1000,
+                 weights: dict[str, float] = WEIGHTS,
+                 ) -> Iterator[tuple[list[str | None], list[int | None]]]:
+
+    rng = random.Random(seed)
+    scorer = LayoutScorer(board, weights)
+
+    while True:
+        candidates = [sample_layout(board, rng)
+                      for _ in range(candidate_count)]
+        yield min(candidates, key=lambda c: scorer.score(*c))
+
+
+def generate_layout(board: Board = STANDARD_BOARD,
+                    seed: int | None = None,
+                    candidate_count: int = 1000,
+                    weights: dict[str, float] = WEIGHTS,
+                    ) -> tuple[list[str | None], list[int | None]]:
+
+    return next(iter_layouts(board, seed, candidate_count, weights))
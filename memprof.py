@@ -0,0 +1,176 @@
+from __future__ import annotations
+from types import FunctionType, ModuleType
+from typing import Any
+import argparse
+import inspect
+import sys
+import tracemalloc
+
+from .state import Game, LogEntry, Choice
+from .actions import Action
+
+
+SKIPPED_TYPES = (type, ModuleType, FunctionType)
+
+
+def get_deep_size(obj: Any, seen: set[int]) -> int:
+
+    size = 0
+    pending = [obj]
+
+    while len(pending) > 0:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, SKIPPED_TYPES):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+
+        if hasattr(item, '__dict__'):
+            pending.append(item.__dict__)
+        for name in getattr(type(item), '__slots__', []):
+            if hasattr(item, name):
+                pending.append(getattr(item, name))
+
+    return size
+
+
+class MemoryReport:
+
+    STATE_PARTS = ['players', 'choices', 'stack', 'deltas', 'other']
+
+    def __init__(self, game: Game):
+
+        self.sizes: dict[str, int] = {}
+        self.state_count = 0
+        self.entry_count = 0
+        self.duplicate_lists = 0
+        self.duplicate_bytes = 0
+
+        seen: set[int] = set()
+        self.sizes['board'] = get_deep_size(game.board, seen)
+        self.sizes['game'] = sys.getsizeof(game) + sum(
+            get_deep_size(v, seen) for k, v in vars(game).items()
+            if k != 'states')
+
+        for part in self.STATE_PARTS:
+            self.sizes['states.' + part] = 0
+        self.sizes['entries'] = 0
+
+        arg_lists: set[tuple] = set()
+
+        for state in game.states:
+            if isinstance(state, LogEntry):
+                self.entry_count += 1
+                self.sizes['entries'] += get_deep_size(state, seen)
+                continue
+
+            self.state_count += 1
+
+            for player in state.players:
+                if player.choice is not None:
+                    self.count_duplicates(player.choice, arg_lists, seen)
+            for player in state.players:
+                self.sizes['states.choices'] += get_deep_size(player.choice,
+                                                              seen)
+            self.sizes['states.players'] += get_deep_size(state.players, seen)
+            self.sizes['states.stack'] += get_deep_size(state.stack, seen)
+            self.sizes['states.deltas'] += get_deep_size(state.deltas, seen)
+            self.sizes['states.other'] += get_deep_size(state, seen)
+
+        self.sizes['total'] = sum(self.sizes.values())
+
+    def count_duplicates(self,
+                         choice: Choice,
+                         arg_lists: set[tuple],
+                         seen: set[int]):
+
+        for option, args in choice.option_args.items():
+            if id(args) in seen:
+                continue
+            key = (choice.action, option, tuple(args))
+            if key in arg_lists:
+                self.duplicate_lists += 1
+                self.duplicate_bytes += sys.getsizeof(args)
+            else:
+                arg_lists.add(key)
+
+    def __str__(self) -> str:
+
+        lines = [f"{self.state_count} states, {self.entry_count} log entries"]
+        for name, size in self.sizes.items():
+            lines.append(f"{name:<24} {size:>12,} bytes")
+        if self.state_count > 0:
+            state_bytes = sum(v for k, v in self.sizes.items()
+                              if k.startswith('states.'))
+            lines.append(f"{'per state':<24} "
+                         f"{state_bytes // self.state_count:>12,} bytes")
+        lines.append(f"duplicated option_args: {self.duplicate_lists} lists, "
+                     f"{self.duplicate_bytes:,} bytes")
+        return "\n".join(lines)
+
+
+def get_handler_lines() -> dict[int, str]:
+
+    handler_lines: dict[int, str] = {}
+    for name, method in inspect.getmembers(Action, inspect.isfunction):
+        lines, first_line = inspect.getsourcelines(method)
+        for line in range(first_line, first_line + len(lines)):
+            handler_lines[line] = name
+    return handler_lines
+
+
+def trace_replay(game: Game, frame_count: int = 32) -> dict[str, int]:
+
+    action_file = inspect.getsourcefile(Action)
+    handler_lines = get_handler_lines()
+
+    records = game.get_records()
+    replay = game.restart()
+
+    tracemalloc.start(frame_count)
+    try:
+        Action(replay, 0).apply_many(records, trusted=True, commit_all=True)
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    sizes: dict[str, int] = {}
+    for statistic in snapshot.statistics('traceback'):
+        handler = 'other'
+        for frame in reversed(statistic.traceback):
+            if frame.filename == action_file:
+                handler = handler_lines.get(frame.lineno, 'other')
+                break
+        sizes[handler] = sizes.get(handler, 0) + statistic.size
+
+    return dict(sorted(sizes.items(), key=lambda s: s[1], reverse=True))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="report the memory held by a saved game")
+    parser.add_argument('path')
+    parser.add_argument('--trace', action='store_true',
+                        help="replay the game under tracemalloc and "
+                             "attribute allocations to Action handlers")
+    args = parser.parse_args()
+
+    game = Game.load(args.path)
+    print(MemoryReport(game))
+
+    if args.trace:
+        print()
+        for handler, size in trace_replay(game).items():
+            print(f"{handler:<24} {size:>12,} bytes")
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import weakref
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+COUNTERS = {
+    'catan_games_created_total': "Games created.",
+    'catan_games_finished_total': "Games won by a player.",
+    'catan_actions_total': "Applied actions by action and option.",
+    'catan_bot_decisions_total': "Decisions made by bot strategies.",
+    'catan_trades_total': "Completed trades between players.",
+}
+
+HISTOGRAMS = {
+    'catan_choose_seconds': (
+        "Latency of Action.choose.",
+        [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0],
+    ),
+    'catan_run_bots_seconds': (
+        "Duration of run_bots calls.",
+        [0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 10.0],
+    ),
+    'catan_history_length': (
+        "Number of states in a game history after a commit.",
+        [10, 50, 100, 250, 500, 1000, 2500, 5000, 10000],
+    ),
+    'catan_state_bytes': (
+        "Size of serialised states in bytes.",
+        [1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000],
+    ),
+}
+
+
+class Shard:
+
+    def __init__(self):
+
+        self.counters: dict[tuple[str, str], int] = {}
+        self.buckets: dict[str, list[int]] = {
+            n: [0] * (len(b) + 1) for n, (_, b) in HISTOGRAMS.items()}
+        self.sums: dict[str, float] = {n: 0.0 for n in HISTOGRAMS}
+
+    def merge(self, other: Shard):
+
+        for key, amount in list(other.counters.items()):
+            self.counters[key] = self.counters.get(key, 0) + amount
+        for name, buckets in other.buckets.items():
+            for index, count in enumerate(list(buckets)):
+                self.buckets[name][index] += count
+            self.sums[name] += other.sums[name]
+
+
+class Metrics:
+
+    def __init__(self):
+
+        self.enabled = True
+        self.local = threading.local()
+        self.shards: dict[int, Shard] = {}
+        self.retired = Shard()  # totals of exited threads
+        self.exited: list[int] = []
+        self.lock = threading.Lock()
+
+    def get_shard(self) -> Shard:
+
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = Shard()
+            self.local.shard = shard
+            with self.lock:
+                self.retire_shards()
+                self.shards[id(shard)] = shard
+            weakref.finalize(threading.current_thread(),
+                             self.exited.append, id(shard))
+        return shard
+
+    def retire_shards(self):
+
+        while len(self.exited) > 0:
+            shard = self.shards.pop(self.exited.pop())
+            self.retired.merge(shard)
+
+    def is_paused(self) -> bool:
+
+        return not self.enabled or getattr(self.local, 'paused', False)
+
+    @contextmanager
+    def pause(self, paused: bool = True):
+
+        previous = getattr(self.local, 'paused', False)
+        self.local.paused = previous or paused
+        try:
+            yield
+        finally:
+            self.local.paused = previous
+
+    def increment(self, name: str, labels: str = "", amount: int = 1):
+
+        if self.is_paused():
+            return
+        counters = self.get_shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float):
+
+        if self.is_paused():
+            return
+        shard = self.get_shard()
+        index = bisect.bisect_left(HISTOGRAMS[name][1], value)
+        shard.buckets[name][index] += 1
+        shard.sums[name] += value
+
+    def render(self) -> str:
+
+        total = Shard()
+        with self.lock:
+            self.retire_shards()
+            total.merge(self.retired)
+            for shard in list(self.shards.values()):
+                total.merge(shard)
+        counters = total.counters
+
+        lines: list[str] = []
+
+        for name, text in COUNTERS.items():
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} counter")
+            values = sorted((k[1], v) for k, v in counters.items()
+                            if k[0] == name)
+            if len(values) == 0:
+                values = [("", 0)]
+            for labels, amount in values:
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}{suffix} {amount}")
+
+        for name, (text, bounds) in HISTOGRAMS.items():
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            bound_labels = [str(b) for b in bounds] + ["+Inf"]
+            for bound, count in zip(bound_labels, total.buckets[name]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum {total.sums[name]}")
+            lines.append(f"{name}_count {cumulative}")
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+
+        with open(path, 'w') as file:
+            file.write(self.render())
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+
+METRICS = Metrics()
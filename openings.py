@@ -0,0 +1,151 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+import pickle
+import random
+
+from .state import Game, Bot
+from .actions import Action
+from .board import Board, STANDARD_BOARD
+from .bots import run_bot
+from .production import score_nodes
+from .rollouts import create_rollout_game, play_rollout
+
+
+class OpeningBook:
+
+    PHASES = ['base1', 'base2']
+
+    def __init__(self):
+
+        self.entries: dict[bytes, dict[str, dict[str, int]]] = {}
+
+    @staticmethod
+    def get_key(game: Game) -> bytes:
+
+        return game.layout_key + bytes([len(game.players)])
+
+    def get_ranking(self,
+                    game: Game,
+                    phase: str,
+                    player_index: int,
+                    ) -> dict[str, int] | None:
+
+        player_count = len(game.players)
+        if player_index != get_forced_player(phase, player_count):
+            return None  # rollouts only measured the forced seat
+        entry = self.entries.get(self.get_key(game))
+        if entry is None:
+            return None
+        baseline = 1000 // player_count  # win rate of an even seat
+        return {n: r for n, r in entry[phase].items() if r > baseline}
+
+    def add_entry(self, game: Game, entry: dict[str, dict[str, int]]):
+
+        self.entries[self.get_key(game)] = entry
+
+    def __len__(self) -> int:
+
+        return len(self.entries)
+
+    @staticmethod
+    def load(path: str) -> OpeningBook:
+
+        book = OpeningBook()
+        with open(path, 'rb') as file:
+            book.entries = pickle.load(file)
+        return book
+
+    def save(self, path: str):
+
+        with open(path, 'wb') as file:
+            pickle.dump(self.entries, file)
+
+
+def get_forced_player(phase: str, player_count: int) -> int:
+
+    return 0 if phase == 'base1' else player_count - 1
+
+
+def evaluate_opening(game: Game,
+                     phase: str,
+                     node_id: str,
+                     seeds: list[int],
+                     max_rounds: int,
+                     ) -> tuple[int, int]:
+
+    player_index = get_forced_player(phase, len(game.players))
+    win_count = 0
+    play_count = 0
+
+    for seed in seeds:
+        random.seed(seed)
+        rollout_game = create_rollout_game(game, game.states[0])
+        rollout_game.in_place = True
+
+        while True:
+            state = rollout_game.states[-1]
+            choice = state.players[player_index].choice
+            if choice is not None and choice.action == phase:
+                break
+            actor = next(i for i, p in enumerate(state.players)
+                         if p.choice is not None)
+            run_bot(rollout_game, actor)
+
+        if node_id not in state.get_basecamp_options():
+            continue
+
+        Action(rollout_game, player_index).choose('camp', node_id)
+        winner_index = play_rollout(rollout_game, seed, max_rounds)
+        play_count += 1
+        if winner_index == player_index:
+            win_count += 1
+
+    return win_count, play_count
+
+
+def compute_entry(game: Game,
+                  executor: ProcessPoolExecutor,
+                  candidate_count: int = 8,
+                  rollout_count: int = 64,
+                  max_rounds: int = 100,
+                  seed: int | None = None,
+                  ) -> dict[str, dict[str, int]]:
+
+    rng = random.Random(seed)
+    node_scores = score_nodes(game, game.states[0].get_basecamp_options())
+    candidates = sorted(node_scores, key=node_scores.get, reverse=True)
+    candidates = candidates[:candidate_count]
+    seeds = [rng.getrandbits(64) for _ in range(rollout_count)]
+
+    futures = {(phase, node_id): executor.submit(
+        evaluate_opening, game, phase, node_id, seeds, max_rounds)
+        for phase in OpeningBook.PHASES for node_id in candidates}
+
+    entry: dict[str, dict[str, int]] = {p: {} for p in OpeningBook.PHASES}
+    for (phase, node_id), future in futures.items():
+        win_count, play_count = future.result()
+        if play_count > 0:
+            entry[phase][node_id] = 1000 * win_count // play_count
+    return entry
+
+
+def build_book(layouts: Iterable[tuple[list, list]],
+               player_count: int = 4,
+               board: Board = STANDARD_BOARD,
+               book: OpeningBook | None = None,
+               max_workers: int | None = None,
+               **options,
+               ) -> OpeningBook:
+
+    if book is None:
+        book = OpeningBook()
+
+    players = [Bot(f"Bot{i}", 'default') for i in range(player_count)]
+
+    with ProcessPoolExecutor(max_workers) as executor:
+        for layout in layouts:
+            game = Game(players, board=board, layout=layout)
+            book.add_entry(game, compute_entry(game, executor, **options))
+
+    return book
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from .state import Game, GameState, Resources
+from .board import ROLL_CHANCES
+
+
+def get_tile_shares(state: GameState, tile_id: str) -> list[int]:
+
+    return [p.tile_shares.get(tile_id, 0) for p in state.players]
+
+
+def get_player_production(game: Game,
+                          state: GameState,
+                          player_index: int,
+                          ) -> list[float]:
+
+    production = state.players[player_index].production
+    share = get_tile_shares(state, state.robber)[player_index]
+    if share == 0:
+        return list(production)
+
+    blocked = game.tile_yields[state.robber]
+    return [p - share * b for p, b in zip(production, blocked)]
+
+
+def get_production_variance(game: Game,
+                            state: GameState,
+                            player_index: int,
+                            ) -> float:
+
+    player = state.players[player_index]
+    incomes = {roll: 0 for roll in ROLL_CHANCES}
+
+    for node_id in player.get_sites():
+        amount = 2 if node_id in player.forts else 1
+        for tile_id in game.board.node_tiles[node_id]:
+            roll = game.rolls[tile_id]
+            if roll is None or tile_id == state.robber:
+                continue
+            incomes[roll] += amount
+
+    mean = sum(ROLL_CHANCES[r] * n for r, n in incomes.items())
+    square = sum(ROLL_CHANCES[r] * n * n for r, n in incomes.items())
+    return square - mean * mean
+
+
+def get_robber_impact(game: Game,
+                      state: GameState,
+                      tile_id: str,
+                      ) -> list[float]:
+
+    roll = game.rolls[tile_id]
+    if roll is None:
+        return [0.0] * len(state.players)
+
+    chance = ROLL_CHANCES[roll]
+    return [chance * s for s in get_tile_shares(state, tile_id)]
+
+
+def score_nodes(game: Game,
+                node_ids: list[str],
+                weights: list[float] | None = None,
+                ) -> dict[str, float]:
+
+    if weights is None:
+        weights = [1.0] * len(Resources.KEYS)
+
+    return {n: sum(w * y for w, y in zip(weights, game.node_yields[n]))
+            for n in node_ids}
+
+
+class RobberTarget:
+
+    def __init__(self,
+                 tile_id: str,
+                 stakes: list[float],
+                 player_index: int,
+                 victims: list[int]):
+
+        self.tile_id = tile_id
+        self.stakes = stakes
+        self.gain = sum(stakes) - 2 * stakes[player_index]
+        self.victims = victims
+
+    def __repr__(self) -> str:
+
+        return f"{self.tile_id}: {self.gain:+.3f} {self.victims}"
+
+    def to_dict(self) -> dict:
+
+        return {
+            'tile': self.tile_id,
+            'stakes': self.stakes,
+            'gain': self.gain,
+            'victims': self.victims,
+        }
+
+
+def rank_robber_targets(game: Game,
+                        state: GameState,
+                        player_index: int,
+                        ) -> list[RobberTarget]:
+
+    points = [state.compute_points(i) for i in range(len(state.players))]
+
+    targets: list[RobberTarget] = []
+    for tile_id in state.get_robber_options():
+        stakes = get_robber_impact(game, state, tile_id)
+        victims = state.get_robber_victims(tile_id, player_index)
+        victims.sort(key=lambda i: (points[i], stakes[i]), reverse=True)
+        targets.append(RobberTarget(tile_id, stakes, player_index, victims))
+
+    targets.sort(key=lambda t: t.gain, reverse=True)
+    return targets
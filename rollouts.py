@@ -0,0 +1,156 @@
+from __future__ import annotations
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures import FIRST_COMPLETED
+import copy
+import math
+import os
+import random
+
+from .state import Game, GameState, Bot
+from .bots import run_bot
+
+
+class WinEstimate:
+
+    def __init__(self, player_count: int):
+
+        self.wins = [0] * player_count
+        self.rollout_count = 0
+        self.unfinished_count = 0
+
+    def add(self, other: WinEstimate):
+
+        for index, wins in enumerate(other.wins):
+            self.wins[index] += wins
+        self.rollout_count += other.rollout_count
+        self.unfinished_count += other.unfinished_count
+
+    def get_probabilities(self) -> list[float]:
+
+        if self.rollout_count == 0:
+            return [0.0] * len(self.wins)
+        return [w / self.rollout_count for w in self.wins]
+
+    def get_intervals(self, z: float = 1.96) -> list[tuple[float, float]]:
+
+        n = self.rollout_count
+        if n == 0:
+            return [(0.0, 1.0)] * len(self.wins)
+
+        intervals: list[tuple[float, float]] = []
+        for p in self.get_probabilities():
+            center = (p + z * z / (2 * n)) / (1 + z * z / n)
+            spread = (z / (1 + z * z / n)
+                      * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)))
+            intervals.append((max(0.0, center - spread),
+                              min(1.0, center + spread)))
+        return intervals
+
+    def get_max_width(self, z: float = 1.96) -> float:
+
+        return max(hi - lo for lo, hi in self.get_intervals(z))
+
+    def __repr__(self) -> str:
+
+        estimates = ", ".join(f"{p:.3f} [{lo:.3f}, {hi:.3f}]"
+                              for p, (lo, hi) in zip(self.get_probabilities(),
+                                                     self.get_intervals()))
+        return f"{estimates} ({self.rollout_count} rollouts)"
+
+
+def create_rollout_game(game: Game,
+                        state: GameState,
+                        strategy: str = 'default',
+                        ) -> Game:
+
+    rollout_game = copy.copy(game)
+    rollout_game.players = [Bot(p.name, strategy) for p in game.players]
+    rollout_game.states = [copy.deepcopy(state)]
+    return rollout_game
+
+
+def play_rollout(base_game: Game, seed: int, max_rounds: int) -> int | None:
+
+    random.seed(seed)
+
+    game = copy.copy(base_game)
+    game.in_place = True
+    state = copy.deepcopy(base_game.states[-1])
+    game.states = [state]
+    random.shuffle(state.stack)
+
+    last_round = state.round + max_rounds
+
+    while True:
+        if state.winner_index >= 0:
+            return state.winner_index
+        if state.round > last_round:
+            return None
+
+        moved = False
+        for index in range(len(game.players)):
+            moved |= run_bot(game, index)
+        if not moved:
+            return None
+
+
+def play_rollouts(base_game: Game,
+                  seeds: list[int],
+                  max_rounds: int,
+                  ) -> WinEstimate:
+
+    estimate = WinEstimate(len(base_game.players))
+    for seed in seeds:
+        winner_index = play_rollout(base_game, seed, max_rounds)
+        estimate.rollout_count += 1
+        if winner_index is None:
+            estimate.unfinished_count += 1
+        else:
+            estimate.wins[winner_index] += 1
+    return estimate
+
+
+def estimate_win_probabilities(game: Game,
+                               state: GameState | None = None,
+                               strategy: str = 'default',
+                               max_rollouts: int = 1000,
+                               batch_size: int = 20,
+                               tolerance: float = 0.1,
+                               z: float = 1.96,
+                               max_rounds: int = 100,
+                               max_workers: int | None = None,
+                               seed: int | None = None,
+                               ) -> WinEstimate:
+
+    if state is None:
+        state = game.states[-1]
+
+    base_game = create_rollout_game(game, state, strategy)
+    estimate = WinEstimate(len(game.players))
+
+    rng = random.Random(seed)
+    batch_count = math.ceil(max_rollouts / batch_size)
+    max_pending = max_workers or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers) as executor:
+        pending: set[Future] = set()
+        submitted = 0
+
+        while submitted < batch_count or len(pending) > 0:
+
+            while submitted < batch_count and len(pending) < max_pending:
+                seeds = [rng.getrandbits(64) for _ in range(batch_size)]
+                pending.add(executor.submit(
+                    play_rollouts, base_game, seeds, max_rounds))
+                submitted += 1
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                estimate.add(future.result())
+
+            if estimate.get_max_width(z) <= 2 * tolerance:
+                for future in pending:
+                    future.cancel()
+                break
+
+    return estimate
@@ -1,10 +1,53 @@
 from __future__ import annotations
 
 import copy
+import hashlib
+import json
+import os
 import pickle
 import random
+import threading
+import weakref
+from collections import Counter
 
 from .board import *
+from .metrics import METRICS
+
+
+ZOBRIST_KEYS: dict[tuple, int] = {}
+
+SPILL_GAMES: weakref.WeakValueDictionary[str, Game] = \
+    weakref.WeakValueDictionary()
+
+
+def get_zobrist_key(*parts) -> int:
+
+    key = ZOBRIST_KEYS.get(parts)
+    if key is None:
+        digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).digest()
+        key = int.from_bytes(digest, 'little')
+        ZOBRIST_KEYS[parts] = key
+    return key
+
+
+def get_outcomes(state: GameState | LogEntry) -> list[int | str]:
+
+    if state.action == 'roll':
+        if state.option == 'robber':
+            return [7]
+        assert isinstance(state.argument, int)
+        return [state.argument]
+    if state.action == 'rob' and state.option == 'player':
+        assert state.actor is not None
+        delta = state.deltas[state.actor]
+        assert delta is not None
+        return [r for r, n in delta.items() if n > 0]
+    return []
+
+
+class ConflictError(RuntimeError):
+
+    pass
 
 
 class Player:
@@ -61,12 +104,67 @@ class Choice:
         self.options: list[str] = []
         self.option_args: dict[str, list] = {}
 
+        self.offered: list[str] = []
+        self.deferred_args: dict[str, tuple[str, tuple]] = {}
+        self.version: int | None = None
+
+    def __getstate__(self) -> dict:
+
+        attrs = self.__dict__.copy()
+        attrs['options'] = list(self.offered)
+        attrs['option_args'] = {o: a for o, a in self.option_args.items()
+                                if o not in self.deferred_args}
+        attrs['version'] = None
+        return attrs
+
+    def __setstate__(self, attrs: dict):
+
+        self.__dict__.update(attrs)
+        if 'offered' not in attrs:  # saved before deferred options
+            self.offered = list(self.options)
+            self.deferred_args = {}
+            self.version = None
+
     def add_option(self, option: str, args: list | None = None):
 
         self.options.append(option)
+        self.offered.append(option)
         if args is not None:
             self.option_args[option] = args
 
+    def defer_option(self, option: str, method: str, *params):
+
+        self.options.append(option)
+        self.offered.append(option)
+        self.deferred_args[option] = (method, params)
+
+    def get_args(self, state: GameState, option: str) -> list | None:
+
+        if option not in self.deferred_args:
+            return self.option_args.get(option)
+
+        if self.version != state.version:
+            for deferred_option in self.deferred_args:
+                self.option_args.pop(deferred_option, None)
+            self.options = list(self.offered)
+            self.version = state.version
+
+        args = self.option_args.get(option)
+        if args is None:
+            method, params = self.deferred_args[option]
+            args = getattr(state, method)(*params)
+            self.option_args[option] = args
+        return args
+
+    def resolve(self, state: GameState):
+
+        for option in self.deferred_args:
+            self.get_args(state, option)
+
+        self.options = [o for o in self.offered
+                        if o not in self.deferred_args
+                        or len(self.option_args[o]) > 0]
+
     def to_dict(self) -> dict:
 
         return {
@@ -95,7 +193,9 @@ class PlayerState:
         "Knight", "Knight", "Knight", "Knight",
     ]
 
-    def __init__(self):
+    def __init__(self, board: Board):
+
+        self.board = board
 
         self.resources = Resources({})
         self.draws: list[str] = []
@@ -104,10 +204,18 @@ class PlayerState:
         self.camps: set[str] = set()
         self.forts: set[str] = set()
 
+        self.frontier: set[str] = set()
+        self.spots: set[str] = set()
+
         self.choice: Choice | None = None
 
         self.road_length = 0
         self.army_size = 0
+        self.points = 0
+
+        self.swap_rates = Resources({k: 4 for k in Resources.KEYS})
+        self.production = [0.0] * len(Resources.KEYS)
+        self.tile_shares: dict[str, int] = {}
 
     def unlock_cards(self):
 
@@ -119,6 +227,63 @@ class PlayerState:
         index = self.cards.index(card)
         del self.cards[index]
 
+    def add_harbor(self, node_id: str):
+
+        if node_id not in self.board.harbor_resources:
+            return
+
+        res_key = self.board.harbor_resources[node_id]
+        if res_key is not None:
+            self.swap_rates[res_key] = 2
+            return
+
+        for key, rate in self.swap_rates.items():
+            if rate > 3:
+                self.swap_rates[key] = 3
+
+    def add_production(self, yields: list[float]):
+
+        self.production = [a + b for a, b in zip(self.production, yields)]
+
+    def add_tile_shares(self, node_id: str):
+
+        for tile_id in self.board.node_tiles[node_id]:
+            self.tile_shares[tile_id] = self.tile_shares.get(tile_id, 0) + 1
+
+    def rebuild_production(self, node_yields: dict[str, list[float]]):
+
+        self.production = [0.0] * len(Resources.KEYS)
+        self.tile_shares = {}
+        for node_id in self.get_sites():
+            self.add_production(node_yields[node_id])
+            self.add_tile_shares(node_id)
+        for node_id in self.forts:
+            self.add_production(node_yields[node_id])
+            self.add_tile_shares(node_id)
+
+    def upgrade(self,
+                state: GameState,
+                player_index: int,
+                node_yields: dict[str, list[float]]):
+
+        if not hasattr(self, 'board'):
+            self.board = state.board
+
+        if not hasattr(self, 'swap_rates'):
+            self.swap_rates = Resources({k: 4 for k in Resources.KEYS})
+            for node_id in self.get_sites():
+                self.add_harbor(node_id)
+
+        if not hasattr(self, 'frontier'):
+            self.frontier = state.recount_road_options(player_index)
+            self.spots = state.recount_camp_options(player_index)
+
+        if not hasattr(self, 'points'):
+            self.points = state.recount_points(player_index)
+
+        if not hasattr(self, 'tile_shares'):
+            self.rebuild_production(node_yields)
+
     def get_sites(self) -> set[str]:
 
         return self.camps | self.forts
@@ -129,7 +294,8 @@ class PlayerState:
 
         conns: set[str] = set()
         for edge_id in self.roads:
-            for node_id, next_edge_ids in CONNECTIONS[edge_id].items():
+            connections = self.board.connections[edge_id]
+            for node_id, next_edge_ids in connections.items():
                 if node_id in sites:
                     continue
                 if any(e in self.roads for e in next_edge_ids):
@@ -140,12 +306,20 @@ class PlayerState:
 
 class GameState:
 
-    def __init__(self, player_count: int, stack: list[str], robber: str):
+    steps: list[tuple] | None = None  # records of a compound move
 
+    def __init__(self,
+                 player_count: int,
+                 stack: list[str],
+                 robber: str,
+                 board: Board = STANDARD_BOARD,
+                 ):
+
+        self.board = board
         self.stack = stack
         self.robber = robber
 
-        self.players = [PlayerState() for _ in range(player_count)]
+        self.players = [PlayerState(board) for _ in range(player_count)]
 
         self.largest_army_index: int | None = None
         self.longest_road_index: int | None = None
@@ -158,19 +332,120 @@ class GameState:
         self.option = 'start'
         self.argument: int | str | None = None
         self.deltas: list[Resources | None] = [None] * player_count
+        self.version = 0
 
         choice = Choice('base1', "")
-        node_ids = self.get_basecamp_options()
-        choice.add_option('camp', node_ids)
+        choice.defer_option('camp', 'get_basecamp_options')
         self.players[0].choice = choice
 
+        self.zobrist = self.compute_zobrist()
+
     def __repr__(self) -> str:
 
         actor = "-" if self.actor is None else self.actor
         return f"{actor}: {self.action}.{self.option}({self.argument})"
 
+    def upgrade(self,
+                board: Board,
+                node_yields: dict[str, list[float]],
+                version: int):
+
+        if not hasattr(self, 'board'):
+            self.board = board
+        if not hasattr(self, 'version'):
+            self.version = version
+
+        for index, player in enumerate(self.players):
+            player.upgrade(self, index, node_yields)
+
+        if not hasattr(self, 'zobrist'):
+            self.zobrist = self.compute_zobrist()
+
+    def compute_zobrist(self) -> int:
+
+        key = get_zobrist_key('robber', self.robber)
+        key ^= get_zobrist_key('current', self.current)
+        key ^= get_zobrist_key('largest', self.largest_army_index)
+        key ^= get_zobrist_key('longest', self.longest_road_index)
+        key ^= get_zobrist_key('winner', self.winner_index)
+
+        for index, player in enumerate(self.players):
+            for edge_id in player.roads:
+                key ^= get_zobrist_key('road', index, edge_id)
+            for node_id in player.camps:
+                key ^= get_zobrist_key('camp', index, node_id)
+            for node_id in player.forts:
+                key ^= get_zobrist_key('fort', index, node_id)
+            for res_key, amount in player.resources.items():
+                key ^= get_zobrist_key('res', index, res_key, amount)
+            key ^= get_zobrist_key('army', index, player.army_size)
+            key ^= self.get_cards_zobrist(index)
+            key ^= self.get_choice_zobrist(index)
+
+        return key
+
+    def get_cards_zobrist(self, player_index: int) -> int:
+
+        player = self.players[player_index]
+
+        key = 0
+        for card, count in Counter(player.cards).items():
+            key ^= get_zobrist_key('card', player_index, card, count)
+        for card, count in Counter(player.draws).items():
+            key ^= get_zobrist_key('draw', player_index, card, count)
+        return key
+
+    def get_choice_zobrist(self, player_index: int) -> int:
+
+        choice = self.players[player_index].choice
+        if choice is None:
+            return 0
+        return get_zobrist_key('choice', player_index, choice.action,
+                               choice.action_params, tuple(choice.offered))
+
+    def verify_zobrist(self):
+
+        zobrist = self.compute_zobrist()
+        assert self.zobrist == zobrist, (self.zobrist, zobrist)
+
+    def toggle_key(self, *parts):
+
+        self.zobrist ^= get_zobrist_key(*parts)
+
+    def toggle_cards(self, player_index: int):
+
+        self.zobrist ^= self.get_cards_zobrist(player_index)
+
+    def set_choice(self, player_index: int, choice: Choice | None):
+
+        self.zobrist ^= self.get_choice_zobrist(player_index)
+        self.players[player_index].choice = choice
+        self.zobrist ^= self.get_choice_zobrist(player_index)
+
+    def set_current(self, player_index: int):
+
+        self.toggle_key('current', self.current)
+        self.current = player_index
+        self.toggle_key('current', self.current)
+
+    def set_robber(self, tile_id: str):
+
+        self.toggle_key('robber', self.robber)
+        self.robber = tile_id
+        self.toggle_key('robber', self.robber)
+
+    def set_winner(self, player_index: int):
+
+        self.toggle_key('winner', self.winner_index)
+        self.winner_index = player_index
+        self.toggle_key('winner', self.winner_index)
+
     def compute_points(self, player_index: int) -> int:
 
+        return self.players[player_index].points
+
+    def recount_points(self, player_index: int) -> int:
+
         player = self.players[player_index]
 
         points = len(player.camps)
@@ -185,12 +460,24 @@ class GameState:
 
         return points
 
+    def verify_points(self):
+
+        for index, player in enumerate(self.players):
+            points = self.recount_points(index)
+            assert player.points == points, (index, player.points, points)
+
+    def transfer_award(self, old_index: int | None, new_index: int):
+
+        if old_index is not None:
+            self.players[old_index].points -= 2
+        self.players[new_index].points += 2
+
     def get_adjacent_owners(self, tile_or_edge_id: str) -> dict[str, int]:
 
-        if tile_or_edge_id in TILE_NODES:
-            adj_node_ids = TILE_NODES[tile_or_edge_id]
+        if tile_or_edge_id in self.board.tile_nodes:
+            adj_node_ids = self.board.tile_nodes[tile_or_edge_id]
         else:
-            adj_node_ids = EDGE_NODES[tile_or_edge_id]
+            adj_node_ids = self.board.edge_nodes[tile_or_edge_id]
 
         owners: dict[str, int] = {}
         for index, player in enumerate(self.players):
@@ -207,7 +494,8 @@ class GameState:
     def get_unlinked_neighbour_nodes(self, node_id: str) -> list[str]:
 
         all_roads = {e for p in self.players for e in p.roads}
-        return [n for e, n in NEIGHBORS[node_id].items() if e not in all_roads]
+        neighbors = self.board.neighbors[node_id]
+        return [n for e, n in neighbors.items() if e not in all_roads]
 
     def get_basecamp_options(self) -> list[str]:
 
@@ -215,7 +503,7 @@ class GameState:
 
         options: list[str] = []
 
-        for node_id, neighbors in NEIGHBORS.items():
+        for node_id, neighbors in self.board.neighbors.items():
             if node_id in all_sites:
                 continue
             if any(n in all_sites for n in neighbors.values()):
@@ -226,45 +514,126 @@ class GameState:
 
     def get_baseroad_options(self, node_id: str) -> list[str]:
 
-        return NODE_EDGES[node_id]
+        return self.board.node_edges[node_id]
 
     def get_robber_options(self) -> list[str]:
 
-        return [t for t in TILE_NODES if t != self.robber]
+        return [t for t in self.board.tile_nodes if t != self.robber]
+
+    def get_robber_victims(self, tile_id: str, player_index: int) -> list[int]:
+
+        return [i for i, p in enumerate(self.players)
+                if i != player_index and tile_id in p.tile_shares
+                and p.resources.count() > 0]
 
     def get_road_options(self, player_index: int) -> list[str]:
 
-        all_roads = {e for p in self.players for e in p.roads}
+        return list(self.players[player_index].frontier)
+
+    def get_camp_options(self, player_index: int) -> list[str]:
+
+        return list(self.players[player_index].spots)
+
+    def is_free_edge(self, edge_id: str) -> bool:
+
+        return not any(edge_id in p.roads for p in self.players)
+
+    def is_free_site(self, node_id: str) -> bool:
+
+        node_ids = [node_id, *self.board.neighbors[node_id].values()]
+        for player in self.players:
+            if any(n in player.camps or n in player.forts for n in node_ids):
+                return False
+        return True
+
+    def is_road_option(self, player_index: int, edge_id: str) -> bool:
+
+        if not self.is_free_edge(edge_id):
+            return False
+
         player_roads = self.players[player_index].roads
         other_sites = self.get_other_sites(player_index)
 
-        options: list[str] = []
+        for node_id, edge_ids in self.board.connections[edge_id].items():
+            if not any(e in player_roads for e in edge_ids):
+                continue
+            if self.board.neighbors[node_id][edge_id] not in other_sites:
+                return True
+        return False
 
-        for edge_id in player_roads:
+    def update_road_options(self, player_index: int, edge_id: str):
 
-            for node_id, edge_ids in CONNECTIONS[edge_id].items():
-                neighbors = NEIGHBORS[node_id]
+        for player in self.players:
+            player.frontier.discard(edge_id)
+
+        player = self.players[player_index]
+
+        for node_id, edge_ids in self.board.connections[edge_id].items():
+            if self.is_free_site(node_id):
+                player.spots.add(node_id)
+            for next_edge_id in edge_ids:
+                if self.is_road_option(player_index, next_edge_id):
+                    player.frontier.add(next_edge_id)
+
+    def update_camp_options(self, player_index: int, node_id: str):
+
+        blocked_node_ids = {node_id, *self.board.neighbors[node_id].values()}
+
+        for index, player in enumerate(self.players):
+            player.spots -= blocked_node_ids
+            if index == player_index:
+                continue
+            for edge_id in self.board.node_edges[node_id]:
+                if edge_id not in player.frontier:
+                    continue
+                if not self.is_road_option(index, edge_id):
+                    player.frontier.discard(edge_id)
+
+    def recount_road_options(self, player_index: int) -> set[str]:
+
+        all_roads = {e for p in self.players for e in p.roads}
+        player_roads = self.players[player_index].roads
+        other_sites = self.get_other_sites(player_index)
+
+        options: set[str] = set()
+        for edge_id in player_roads:
+            for node_id, edge_ids in self.board.connections[edge_id].items():
+                neighbors = self.board.neighbors[node_id]
                 for next_edge_id in edge_ids:
                     if next_edge_id in all_roads:
                         continue
-                    if next_edge_id in options:
-                        continue
                     if neighbors[next_edge_id] not in other_sites:
-                        options.append(next_edge_id)
-
+                        options.add(next_edge_id)
         return options
 
-    def get_camp_options(self, player_index: int) -> list[str]:
+    def recount_camp_options(self, player_index: int) -> set[str]:
 
-        player_roads = set(self.players[player_index].roads)
+        player_roads = self.players[player_index].roads
+        node_edges = self.board.node_edges
+        return {n for n in self.get_basecamp_options()
+                if any(e in player_roads for e in node_edges[n])}
 
-        options: list[str] = []
+    def verify_options(self):
 
-        for node_id in self.get_basecamp_options():
-            if any(e in player_roads for e in NODE_EDGES[node_id]):
-                options.append(node_id)
+        for index, player in enumerate(self.players):
+            frontier = self.recount_road_options(index)
+            assert player.frontier == frontier, (index, player.frontier)
+            spots = self.recount_camp_options(index)
+            assert player.spots == spots, (index, player.spots)
 
-        return options
+    def get_network_distances(self, player_index: int) -> dict[str, int]:
+
+        player = self.players[player_index]
+        edge_nodes = self.board.edge_nodes
+        origin_node_ids = {n for e in player.roads for n in edge_nodes[e]}
+        origin_node_ids |= player.get_sites()
+
+        other_roads = {e for i, p in enumerate(self.players)
+                       if i != player_index for e in p.roads}
+        other_sites = self.get_other_sites(player_index)
+
+        return self.board.get_distances(
+            origin_node_ids, other_roads, other_sites)
 
     def get_fort_options(self, player_index: int) -> list[str]:
 
@@ -272,12 +641,7 @@ class GameState:
 
     def get_swap_rate(self, player_index: int, res_key: str) -> int:
 
-        node_ids = self.players[player_index].get_sites()
-        if any(n in SPECIFIC_HARBORS[res_key] for n in node_ids):
-            return 2
-        if any(n in GENERIC_HARBORS for n in node_ids):
-            return 3
-        return 4
+        return self.players[player_index].swap_rates[res_key]
 
     def update_road_length(self, player_index: int):
 
@@ -286,70 +650,87 @@ class GameState:
         player_roads = set(player.roads)
         other_sites = self.get_other_sites(player_index)
 
-        road_length = get_max_road_length(player_roads, other_sites)
+        road_length = self.board.get_max_road_length(player_roads, other_sites)
 
         player.road_length = road_length
         if road_length < 5:
             return
 
-        if self.longest_road_index is None:
-            self.longest_road_index = player_index
-        else:
-            current = self.players[self.longest_road_index]
-            if road_length > current.road_length:
-                self.longest_road_index = player_index
+        old_index = self.longest_road_index
+        if old_index == player_index:
+            return
+
+        if old_index is not None:
+            current = self.players[old_index]
+            if road_length <= current.road_length:
+                return
+
+        self.longest_road_index = player_index
+        self.toggle_key('longest', old_index)
+        self.toggle_key('longest', player_index)
+        self.transfer_award(old_index, player_index)
 
     def increment_army_size(self, player_index: int):
 
         player = self.players[player_index]
 
         army_size = player.army_size + 1
+        self.toggle_key('army', player_index, player.army_size)
+        self.toggle_key('army', player_index, army_size)
         player.army_size = army_size
 
         if army_size < 3:
             return
 
-        if self.largest_army_index is None:
-            self.largest_army_index = player_index
-        else:
-            current = self.players[self.largest_army_index]
-            if army_size > current.army_size:
-                self.largest_army_index = player_index
+        old_index = self.largest_army_index
+        if old_index == player_index:
+            return
 
-    def to_dict(self, target_index: int) -> dict:
+        if old_index is not None:
+            current = self.players[old_index]
+            if army_size <= current.army_size:
+                return
 
-        player_dicts: list[dict] = []
+        self.largest_army_index = player_index
+        self.toggle_key('largest', old_index)
+        self.toggle_key('largest', player_index)
+        self.transfer_award(old_index, player_index)
 
-        for index, player in enumerate(self.players):
+    def get_public_dict(self, player_index: int) -> dict:
 
-            player_dict: dict = {
-                'resourceCount': player.resources.count(),
-                'handCount': len(player.cards + player.draws),
-                'roads': list(player.roads),
-                'conns': list(player.get_conns()),
-                'camps': list(player.camps),
-                'forts': list(player.forts),
-                'knightCount': player.army_size,
-                'roadLength': player.road_length,
-            }
+        player = self.players[player_index]
 
-            if index == target_index:
+        return {
+            'resourceCount': player.resources.count(),
+            'handCount': len(player.cards + player.draws),
+            'roads': list(player.roads),
+            'conns': list(player.get_conns()),
+            'camps': list(player.camps),
+            'forts': list(player.forts),
+            'knightCount': player.army_size,
+            'roadLength': player.road_length,
+        }
 
-                swap_rates = Resources({})
-                for res_key in Resources.KEYS:
-                    swap_rates[res_key] = self.get_swap_rate(index, res_key)
+    def get_private_dict(self, player_index: int) -> dict:
 
-                player_dict['resources'] = player.resources
-                player_dict['swapRates'] = swap_rates
-                player_dict['cards'] = player.cards
-                player_dict['draws'] = player.draws
-                player_dict['points'] = self.compute_points(index)
-                if player.choice is not None:
-                    player_dict['choice'] = player.choice.to_dict()
+        player = self.players[player_index]
 
-            player_dicts.append(player_dict)
+        private_dict: dict = {
+            'resources': player.resources,
+            'swapRates': Resources(player.swap_rates),
+            'cards': player.cards,
+            'draws': player.draws,
+            'points': self.compute_points(player_index),
+        }
+        if player.choice is not None:
+            player.choice.resolve(self)
+            private_dict['choice'] = player.choice.to_dict()
+
+        return private_dict
 
-        state_dict = {
+    def get_shared_dict(self) -> dict:
+
+        return {
             'round': self.round,
             'current': self.current,
             'robber': self.robber,
@@ -360,62 +741,402 @@ class GameState:
             'action': self.action,
             'option': self.option,
             'argument': self.argument,
-            'players': player_dicts,
         }
 
+    def to_dict(self, target_index: int) -> dict:
+
+        player_dicts: list[dict] = []
+
+        for index in range(len(self.players)):
+            player_dict = self.get_public_dict(index)
+            if index == target_index:
+                player_dict.update(self.get_private_dict(index))
+            player_dicts.append(player_dict)
+
+        state_dict = self.get_shared_dict()
+        state_dict['players'] = player_dicts
+
         if target_index is not None:
             state_dict['delta'] = self.deltas[target_index]
 
         return state_dict
 
+    def to_dicts(self) -> list[dict]:
 
-class Game:
+        shared_dict = self.get_shared_dict()
+        public_dicts = [self.get_public_dict(i)
+                        for i in range(len(self.players))]
 
-    WIN_POINTS = 10
+        state_dicts: list[dict] = []
 
-    SPIRAL_TILE_IDS = [
-        'A3', 'A2', 'A1', 'B1', 'C1', 'D1', 'E1', 'E2', 'E3', 'D4',
-        'C5', 'B4', 'B3', 'B2', 'C2', 'D2', 'D3', 'C4', 'C3',
-    ]
+        for index in range(len(self.players)):
+            player_dicts = list(public_dicts)
+            player_dicts[index] = {
+                **public_dicts[index], **self.get_private_dict(index)}
 
-    BEGINNER_YIELDS = [
-        "R4", "R3", "R0", "R1", "R4", "R3", "R3", "R2", "R1", "R0",
-        "R2", "R2", "R1", "R3", "R0", "R2", "R4", "R0", None,
-    ]
+            state_dict = dict(shared_dict)
+            state_dict['players'] = player_dicts
+            state_dict['delta'] = self.deltas[index]
+            state_dicts.append(state_dict)
+
+        return state_dicts
+
+    def to_jsons(self) -> list[bytes]:
+
+        shared_json = json.dumps(self.get_shared_dict())[:-1]
+        public_jsons = [json.dumps(self.get_public_dict(i))
+                        for i in range(len(self.players))]
+
+        state_jsons: list[bytes] = []
+
+        for index in range(len(self.players)):
+            private_json = json.dumps(self.get_private_dict(index))
+            player_jsons = list(public_jsons)
+            player_jsons[index] = (
+                public_jsons[index][:-1] + ", " + private_json[1:])
+
+            delta_json = json.dumps(self.deltas[index])
+            state_json = (f"{shared_json}, \"players\": "
+                          f"[{', '.join(player_jsons)}], "
+                          f"\"delta\": {delta_json}}}")
+            state_bytes = state_json.encode()
+            METRICS.observe('catan_state_bytes', len(state_bytes))
+            state_jsons.append(state_bytes)
+
+        return state_jsons
+
+
+class LogEntry:
 
-    BEGINNER_ROLLS = [
-        10, 2, 9, 10, 8, 5, 11, 6, 5, 8, 9, 12, 6, 4, 3, 4, 3, 11, None,
+    FIELDS = [
+        'version', 'round', 'current', 'robber', 'largest_army_index',
+        'longest_road_index', 'winner_index', 'actor', 'action', 'option',
+        'argument', 'deltas', 'steps',
     ]
 
-    VARIABLE_ROLLS: list[int | None] = [
-        5, 2, 6, 3, 8, 10, 9, 12, 11, 4, 8, 10, 9, 4, 5, 6, 3, 11
+    PUBLIC_KEYS = [
+        'resourceCount', 'handCount', 'roads', 'conns', 'camps', 'forts',
+        'knightCount', 'roadLength',
     ]
 
-    def __init__(self, players: list[Player], randomize_map: bool = True):
+    __slots__ = FIELDS + ['publics']
+
+    version: int
+    round: int
+    current: int
+    robber: str
+    largest_army_index: int | None
+    longest_road_index: int | None
+    winner_index: int
+    actor: int | None
+    action: str
+    option: str
+    argument: int | str | None
+    deltas: list[Resources | None]
+    steps: list[tuple] | None
+    publics: list[tuple]
+
+    def __init__(self, state: GameState, newer: LogEntry | None = None):
+
+        for name in self.FIELDS:
+            setattr(self, name, getattr(state, name))
+
+        self.publics = []
+        for index in range(len(state.players)):
+            public_dict = state.get_public_dict(index)
+            public = [tuple(sorted(v)) if isinstance(v, list) else v
+                      for v in (public_dict[k] for k in self.PUBLIC_KEYS)]
+            if newer is not None:  # share unchanged values with newer entry
+                public = [n if n == v else v
+                          for n, v in zip(newer.publics[index], public)]
+            self.publics.append(tuple(public))
+
+    def __getstate__(self) -> dict:
+
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, attrs: dict):
+
+        for name in self.__slots__:
+            setattr(self, name, attrs.get(name))
+
+    def __repr__(self) -> str:
+
+        actor = "-" if self.actor is None else self.actor
+        return f"{actor}: {self.action} > {self.option} > {self.argument}"
+
+    def get_shared_dict(self) -> dict:
+
+        return {
+            'round': self.round,
+            'current': self.current,
+            'robber': self.robber,
+            'largest': self.largest_army_index,
+            'longest': self.longest_road_index,
+            'winner': self.winner_index,
+            'actor': self.actor,
+            'action': self.action,
+            'option': self.option,
+            'argument': self.argument,
+        }
+
+    def get_public_dict(self, player_index: int) -> dict:
+
+        public = self.publics[player_index]
+        return {k: list(v) if isinstance(v, tuple) else v
+                for k, v in zip(self.PUBLIC_KEYS, public)}
+
+    def to_dict(self, target_index: int) -> dict:
+
+        state_dict = self.get_shared_dict()
+        if self.publics is not None:
+            state_dict['players'] = [self.get_public_dict(i)
+                                     for i in range(len(self.publics))]
+        if target_index is not None:
+            state_dict['delta'] = self.deltas[target_index]
+        return state_dict
+
+    def to_dicts(self) -> list[dict]:
+
+        return [self.to_dict(i) for i in range(len(self.deltas))]
+
+
+class Game:
+
+    WIN_POINTS = 10
+
+    in_place = False  # apply actions to the last state without history
+
+    history_limit: int | None = None
+    spill_path: str | None = None
+    spilled_count = 0
+
+    SPIRAL_TILE_IDS = STANDARD_BOARD.tile_ids
+    BEGINNER_YIELDS = STANDARD_BOARD.yields
+    BEGINNER_ROLLS = STANDARD_BOARD.rolls
+    VARIABLE_ROLLS = STANDARD_BOARD.variable_rolls
+
+    def __init__(self,
+                 players: list[Player],
+                 randomize_map: bool = True,
+                 board: Board = STANDARD_BOARD,
+                 layout: tuple[list, list] | None = None,
+                 ):
 
         self.players = players
+        self.board = board
 
-        if randomize_map:
-            yields = copy.deepcopy(self.BEGINNER_YIELDS)
-            rolls = copy.deepcopy(self.VARIABLE_ROLLS)
+        if layout is not None:
+            yields, rolls = layout
+        elif randomize_map:
+            yields = copy.deepcopy(board.yields)
+            rolls = copy.deepcopy(board.variable_rolls)
             random.shuffle(yields)
-            desert_index = yields.index(None)
-            rolls.insert(desert_index, None)
+            for index, res_key in enumerate(yields):
+                if res_key is None:
+                    rolls.insert(index, None)
         else:
-            yields = self.BEGINNER_YIELDS
-            rolls = self.BEGINNER_ROLLS
-            desert_index = len(yields) - 1
+            yields = board.yields
+            rolls = board.rolls
 
-        self.yields = dict(zip(self.SPIRAL_TILE_IDS, yields))
-        self.rolls = dict(zip(self.SPIRAL_TILE_IDS, rolls))
-        robber = self.SPIRAL_TILE_IDS[desert_index]
+        robber = self.set_layout(yields, rolls)
 
         stack = PlayerState.VICTORY_CARDS + PlayerState.PROGRESS_CARDS
         random.shuffle(stack)
 
-        initial_state = GameState(len(players), stack, robber)
+        initial_state = GameState(len(players), stack, robber, board)
 
         self.states = [initial_state]
+        self.lock = threading.RLock()
+
+        METRICS.increment('catan_games_created_total')
+
+    def __getstate__(self) -> dict:
+
+        attrs = self.__dict__.copy()
+        del attrs['lock']
+        return attrs
+
+    def __setstate__(self, attrs: dict):
+
+        self.__dict__.update(attrs)
+        self.lock = threading.RLock()
+
+        if self.spill_path is not None:
+            SPILL_GAMES.setdefault(os.path.abspath(self.spill_path), self)
+
+        if 'board' not in attrs:  # saved before compiled boards
+            self.board = STANDARD_BOARD
+
+        if 'node_yields' not in attrs:  # saved before production tables
+            tile_ids = self.board.tile_ids
+            self.set_layout([self.yields[t] for t in tile_ids],
+                            [self.rolls[t] for t in tile_ids])
+        elif 'layout_key' not in attrs:
+            self.layout_key = self.compute_layout_key()
+
+        for version, state in enumerate(self.states):
+            if isinstance(state, GameState):
+                state.upgrade(self.board, self.node_yields, version)
+
+    def set_layout(self,
+                   yields: list[str | None],
+                   rolls: list[int | None],
+                   ) -> str:
+
+        self.yields = dict(zip(self.board.tile_ids, yields))
+        self.rolls = dict(zip(self.board.tile_ids, rolls))
+
+        self.roll_tiles: dict[int, list[str]] = {}
+        for tile_id, roll in self.rolls.items():
+            if roll is not None:
+                self.roll_tiles.setdefault(roll, []).append(tile_id)
+
+        self.tile_yields: dict[str, list[float]] = {}
+        for tile_id, res_key in self.yields.items():
+            tile_yields = [0.0] * len(Resources.KEYS)
+            roll = self.rolls[tile_id]
+            if res_key is not None and roll is not None:
+                res_index = Resources.KEYS.index(res_key)
+                tile_yields[res_index] = ROLL_CHANCES[roll]
+            self.tile_yields[tile_id] = tile_yields
+
+        self.node_yields: dict[str, list[float]] = {}
+        for node_id, tile_ids in self.board.node_tiles.items():
+            self.node_yields[node_id] = [
+                sum(self.tile_yields[t][i] for t in tile_ids)
+                for i in range(len(Resources.KEYS))]
+
+        self.layout_key = self.compute_layout_key()
+
+        desert_index = yields.index(None)
+        return self.board.tile_ids[desert_index]
+
+    def compute_layout_key(self) -> bytes:
+
+        layout = [(t, self.yields[t], self.rolls[t])
+                  for t in self.board.tile_ids]
+        return hashlib.blake2b(repr(layout).encode(), digest_size=16).digest()
+
+    @property
+    def version(self) -> int:
+
+        return self.states[-1].version
+
+    def append_state(self, state: GameState, version: int):
+
+        with self.lock:
+            if self.version != version:
+                raise ConflictError(
+                    f"state based on version {version}, "
+                    f"game is at version {self.version}")
+            self.states.append(state)
+            if self.history_limit is not None:
+                self.compact_history()
+
+    def set_history_limit(self,
+                          limit: int | None,
+                          spill_path: str | None = None):
+
+        with self.lock:
+            if spill_path != self.spill_path:
+                self.set_spill_path(spill_path)
+            self.history_limit = limit
+            if limit is not None:
+                self.compact_history()
+
+    def set_spill_path(self, spill_path: str | None):
+
+        if self.spilled_count > 0:
+            raise RuntimeError(f"history already spilled to {self.spill_path}")
+
+        if spill_path is not None:
+            owner = SPILL_GAMES.get(os.path.abspath(spill_path))
+            if owner is not None and owner is not self:
+                raise RuntimeError(f"spill path {spill_path} is in use")
+            open(spill_path, 'wb').close()
+
+        if self.spill_path is not None:
+            SPILL_GAMES.pop(os.path.abspath(self.spill_path), None)
+        if spill_path is not None:
+            SPILL_GAMES[os.path.abspath(spill_path)] = self
+        self.spill_path = spill_path
+
+    def compact_history(self):
+
+        limit = self.history_limit
+        assert limit is not None and limit > 0, limit
+
+        newer: LogEntry | None = None
+        for index in range(len(self.states) - 1 - limit, 0, -1):
+            state = self.states[index]
+            if not isinstance(state, GameState):
+                break
+            newer = LogEntry(state, newer)
+            self.states[index] = newer
+
+        if self.spill_path is None:
+            return
+
+        entry_count = len(self.states) - 1 - limit
+        if entry_count < limit:
+            return
+
+        owner = SPILL_GAMES.get(os.path.abspath(self.spill_path))
+        if owner is not self:
+            raise RuntimeError(f"spill path {self.spill_path} is in use")
+
+        with open(self.spill_path, 'ab') as file:
+            for entry in self.states[1:1 + entry_count]:
+                pickle.dump(entry, file)
+        del self.states[1:1 + entry_count]
+        self.spilled_count += entry_count
+
+    def get_history(self) -> list[GameState | LogEntry]:
+
+        if self.spilled_count == 0:
+            return list(self.states)
+
+        assert self.spill_path is not None
+        spilled: list[GameState | LogEntry] = []
+        with open(self.spill_path, 'rb') as file:
+            for _ in range(self.spilled_count):
+                spilled.append(pickle.load(file))
+
+        return self.states[:1] + spilled + self.states[1:]
+
+    def restart(self) -> Game:
+
+        game = copy.copy(self)
+        game.states = [copy.deepcopy(self.states[0])]
+        game.spill_path = None
+        game.spilled_count = 0
+        return game
+
+    def get_steps(self) -> list[tuple[str, tuple]]:
+
+        steps: list[tuple[str, tuple]] = []
+
+        for state in self.get_history()[1:]:
+            if state.steps is not None:
+                for actor, action, option, argument, outcomes in state.steps:
+                    steps.append((action, (actor, option, argument,
+                                           list(outcomes))))
+                continue
+
+            outcomes = get_outcomes(state)
+            if state.action == 'roll':
+                steps[-1][1][3].extend(outcomes)
+                continue
+
+            steps.append((state.action, (state.actor, state.option,
+                                         state.argument, outcomes)))
+
+        return steps
+
+    def get_records(self) -> list[tuple]:
+
+        return [record for _, record in self.get_steps()]
 
     @staticmethod
     def load(path: str):
@@ -425,7 +1146,7 @@ class Game:
 
     def save(self, path: str):
 
-        with open(path, 'wb') as file:
+        with open(path, 'wb') as file, self.lock:
             pickle.dump(self, file)
 
     def get_player_index(self, secret: str) -> int | None:
@@ -439,7 +1160,7 @@ class Game:
     def get_home_yields(self, node_id: str) -> Resources:
 
         yields = Resources({})
-        for tile_id in NODE_TILES[node_id]:
+        for tile_id in self.board.node_tiles[node_id]:
             res_key = self.yields[tile_id]
             if res_key is not None:
                 yields[res_key] += 1
@@ -447,20 +1168,19 @@ class Game:
 
     def add_yields(self, state: GameState, roll: int):
 
-        for tile_id in self.SPIRAL_TILE_IDS:
-            if self.rolls[tile_id] != roll:
-                continue
+        for tile_id in self.roll_tiles.get(roll, []):
             if state.robber == tile_id:
                 continue
             res_key = self.yields[tile_id]
-            owners = state.get_adjacent_owners(tile_id)
-            for node_id, index in owners.items():
-                is_fort = node_id in state.players[index].forts
+            for index, player in enumerate(state.players):
+                share = player.tile_shares.get(tile_id, 0)
+                if share == 0:
+                    continue
                 resources = state.deltas[index]
                 if resources is None:
                     resources = Resources({})
                     state.deltas[index] = resources
-                resources[res_key] += 2 if is_fort else 1
+                resources[res_key] += share
 
     def to_dict(self, target_index: int) -> dict:
 
@@ -469,5 +1189,18 @@ class Game:
             'players': [p.name for p in self.players],
             'yields': self.yields,
             'rolls': self.rolls,
-            'states': [s.to_dict(target_index) for s in self.states[:-1]],
+            'states': [s.to_dict(target_index)
+                       for s in self.get_history()[:-1]],
         }
+
+    def to_dicts(self) -> list[dict]:
+
+        state_dicts = [s.to_dicts() for s in self.get_history()[:-1]]
+
+        return [{
+            'goal': self.WIN_POINTS,
+            'players': [p.name for p in self.players],
+            'yields': self.yields,
+            'rolls': self.rolls,
+            'states': [d[index] for d in state_dicts],
+        } for index in range(len(self.players))]
@@ -0,0 +1,185 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import pickle
+import random
+
+from .state import Game, Bot
+from .bots import DefaultStrategy, STRATEGIES
+from .rollouts import play_rollout
+
+
+PARAMETERS = [  # name, lower bound, upper bound
+    ('R0', 0, 4),
+    ('R1', 0, 4),
+    ('R2', 0, 4),
+    ('R3', 0, 4),
+    ('R4', 0, 5),
+    ('card_points', 2, 9),
+    ('card_multi_points', 0, 8),
+    ('trade_resources', 3, 12),
+    ('swap_min_rank', 0, 4),
+]
+
+
+def get_default_vector() -> list[int]:
+
+    values = {**DefaultStrategy.BASE_LEVELS, **DefaultStrategy.PARAMS}
+    return [values[name] for name, _, _ in PARAMETERS]
+
+
+def get_config(vector: list[int]) -> dict:
+
+    values = {name: v for (name, _, _), v in zip(PARAMETERS, vector)}
+    return {
+        'base_levels': {k: values[k] for k in DefaultStrategy.BASE_LEVELS},
+        'params': {k: values[k] for k in DefaultStrategy.PARAMS},
+    }
+
+
+def register_strategy(name: str, config: dict) -> str:
+
+    STRATEGIES[name] = type(f"TunedStrategy_{name}", (DefaultStrategy,), {
+        'BASE_LEVELS': dict(config['base_levels']),
+        'PARAMS': dict(config['params']),
+    })
+    return name
+
+
+def load_strategy(path: str, name: str = 'tuned') -> str:
+
+    with open(path) as file:
+        return register_strategy(name, json.load(file))
+
+
+def save_strategy(path: str, vector: list[int]):
+
+    with open(path, 'w') as file:
+        json.dump(get_config(vector), file, indent=2)
+
+
+def evaluate_vector(vector: list[int],
+                    seeds: list[int],
+                    player_count: int,
+                    max_rounds: int,
+                    ) -> float:
+
+    name = register_strategy('candidate', get_config(vector))
+
+    score = 0.0
+    for seed in seeds:
+        random.seed(seed)
+        seat = seed % player_count
+        players = [Bot(f"Bot{i}", name if i == seat else 'default')
+                   for i in range(player_count)]
+        game = Game(players)
+        winner_index = play_rollout(game, seed, max_rounds)
+        if winner_index == seat:
+            score += 1
+    return score / len(seeds)
+
+
+class Tuner:
+
+    def __init__(self,
+                 checkpoint_path: str,
+                 population_size: int = 16,
+                 elite_count: int = 4,
+                 game_count: int = 64,
+                 player_count: int = 4,
+                 max_rounds: int = 100,
+                 mutation_rate: float = 0.2,
+                 seed: int | None = None):
+
+        self.checkpoint_path = checkpoint_path
+        self.population_size = population_size
+        self.elite_count = elite_count
+        self.game_count = game_count
+        self.player_count = player_count
+        self.max_rounds = max_rounds
+        self.mutation_rate = mutation_rate
+
+        self.rng = random.Random(seed)
+        self.generation = 0
+        self.population = [get_default_vector()]
+        while len(self.population) < population_size:
+            self.population.append(self.mutate(get_default_vector()))
+        self.best: tuple[float, list[int]] | None = None
+
+        if os.path.exists(checkpoint_path):
+            self.load_checkpoint()
+
+    def load_checkpoint(self):
+
+        with open(self.checkpoint_path, 'rb') as file:
+            attrs = pickle.load(file)
+        self.generation = attrs['generation']
+        self.population = attrs['population']
+        self.best = attrs['best']
+        self.rng.setstate(attrs['rng'])
+
+    def save_checkpoint(self):
+
+        attrs = {
+            'generation': self.generation,
+            'population': self.population,
+            'best': self.best,
+            'rng': self.rng.getstate(),
+        }
+        temp_path = self.checkpoint_path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            pickle.dump(attrs, file)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def mutate(self, vector: list[int]) -> list[int]:
+
+        mutant: list[int] = []
+        for (_, low, high), value in zip(PARAMETERS, vector):
+            if self.rng.random() < self.mutation_rate:
+                value += self.rng.choice([-2, -1, 1, 2])
+            mutant.append(min(high, max(low, value)))
+        return mutant
+
+    def crossover(self, a: list[int], b: list[int]) -> list[int]:
+
+        return [self.rng.choice(pair) for pair in zip(a, b)]
+
+    def evaluate(self,
+                 executor: ProcessPoolExecutor,
+                 ) -> list[tuple[float, list[int]]]:
+
+        seeds = [self.rng.getrandbits(64) for _ in range(self.game_count)]
+        futures = [executor.submit(evaluate_vector, v, seeds,
+                                   self.player_count, self.max_rounds)
+                   for v in self.population]
+        scored = [(f.result(), v) for f, v in zip(futures, self.population)]
+        scored.sort(key=lambda s: s[0], reverse=True)
+        return scored
+
+    def step(self, executor: ProcessPoolExecutor):
+
+        scored = self.evaluate(executor)
+        self.best = scored[0]
+
+        elites = [v for _, v in scored[:self.elite_count]]
+        population = list(elites)
+        while len(population) < self.population_size:
+            a, b = self.rng.sample(elites, 2)
+            population.append(self.mutate(self.crossover(a, b)))
+
+        self.population = population
+        self.generation += 1
+        self.save_checkpoint()
+
+    def run(self,
+            generation_count: int,
+            max_workers: int | None = None,
+            ) -> tuple[float, list[int]]:
+
+        with ProcessPoolExecutor(max_workers) as executor:
+            while self.generation < generation_count:
+                self.step(executor)
+
+        assert self.best is not None
+        return self.best